@@ -1,49 +1,107 @@
 print("APP.PY LOADED")
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from backend.rag import ChatPDF
+from backend.sessions import SessionStore
+from backend.registry import DocumentRegistry
+from backend.vector_index import VectorIndex
+from backend.jobs import IngestJobs, QueueFull
 from backend.auth import require_auth
 from backend.limits import check_limits
 import os
-import tempfile
 
 from backend.limits import check_limits, get_user_limits
-from backend.logger import log_qa
-import nltk
-import os
+from backend.logger import log_qa, queue_depth
+from backend import metrics
+from backend.answer_cache import answer_cache
+from backend.ingest_cache import ingest_cache
+from backend.context import context_packer
+from backend.embeddings import loaded_embedding_service
+from backend.llm import LLMBusy, LLMDeadlineExceeded, loaded_llm_gateway
+from backend.rerank import loaded_reranker
+from backend.uploads import UploadRequest, MAX_UPLOAD_MB, MAX_UPLOAD_PAGES, count_pages, sweep_stale_uploads
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+import json
 
-import nltk
-import os
+# NLTK data for unstructured is checked on first partition (backend/partition.py)
 
-NLTK_DATA_PATH = "/opt/render/nltk_data"
-os.makedirs(NLTK_DATA_PATH, exist_ok=True)
-nltk.data.path.append(NLTK_DATA_PATH)
 
-required_packages = [
-    "punkt",
-    "punkt_tab",
-    "averaged_perceptron_tagger",
-    "averaged_perceptron_tagger_eng"
-]
+app = Flask(__name__, static_folder="frontend", static_url_path=None)
+# Uploads stream straight to disk (hashed on the way), capped per file and per request
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = (MAX_UPLOAD_MB + 1) * 1024 * 1024
+sweep_stale_uploads()
 
-for pkg in required_packages:
-    try:
-        nltk.data.find(pkg)
-    except LookupError:
-        nltk.download(pkg, download_dir=NLTK_DATA_PATH)
+def restore_session(record):
+    # Reopens the memory-mapped indexes another worker (or a previous run) built
+    chatpdf = ChatPDF()
+    for file in record["files"]:
+        chatpdf.add_document(VectorIndex.load(file["directory"]), document_name=file["name"], file_id=file["file_id"])
+    return chatpdf
 
 
+# Which index directories make up each document and how each ingest job
+# ended, on disk so every gunicorn worker and restart sees them
+registry = DocumentRegistry()
+
+# One ChatPDF per (user, document), LRU + idle-TTL bounded
+sessions = SessionStore(registry=registry, restore=restore_session)
+
+
+def on_ingest_ready(job, vector_index):
+    # Runs in this worker once the pool process has partitioned + embedded
+    document_id = job["target_document_id"]
+    if document_id:
+        # Append to a loaded session: only the new file is indexed
+        session = sessions.get(job["user_id"], document_id)
+        if session is None:
+            raise RuntimeError("Document session expired before the file was added")
+        chatpdf = session["chatpdf"]
+        chatpdf.add_document(vector_index, document_name=job["document_name"], file_id=job["file_id"])
+        # Re-put so the memory budget sees the larger index
+        sessions.put(job["user_id"], document_id, chatpdf, document_name=session["document_name"])
+        return document_id
+
+    chatpdf = ChatPDF()
+    chatpdf.load(vector_index, document_name=job["document_name"], file_id=job["file_id"])
+    document_id = sessions.new_document_id()
+    sessions.put(job["user_id"], document_id, chatpdf, document_name=job["document_name"])
+    return document_id
+
+
+ingest_jobs = IngestJobs(on_ready=on_ingest_ready, registry=registry)
+
+# Optional bearer token for /api/metrics (unset = open, e.g. behind a private network)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@app.before_request
+def start_trace():
+    metrics.start_trace()
+
+
+@app.teardown_request
+def discard_uploads(error=None):
+    # Every uploaded file not handed to an ingest job is deleted with its request
+    request.discard_unclaimed_uploads()
 
-app = Flask(__name__, static_folder="frontend", static_url_path=None)
 
-chatpdf = ChatPDF()
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(error):
+    return jsonify({"error": f"File too large (max {MAX_UPLOAD_MB} MB)"}), 413
+
+
+@app.errorhandler(UnsupportedMediaType)
+def upload_not_pdf(error):
+    return jsonify({"error": "Only PDF files are supported"}), 415
 
 
 @app.route("/api/upload", methods=["POST"])
 @require_auth
 def upload(user):
     # 🔒 limit check FIRST
-    allowed = check_limits(user["id"], "upload")
+    with metrics.span("limits"):
+        allowed = check_limits(user["id"], "upload")
     if not allowed:
         return jsonify({"error": "Upload limit reached"}), 429
 
@@ -52,50 +110,201 @@ def upload(user):
 
     file = request.files["file"]
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        file.save(tmp.name)
-        tmp_path = tmp.name
+    # Optional: add this PDF to an already loaded document session
+    target_document_id = request.form.get("document_id")
+    if target_document_id and sessions.get(user["id"], target_document_id) is None:
+        return jsonify({"error": "Document not loaded, please upload it again"}), 404
+
+    # Already on disk: the body was streamed into an UploadFile while parsing
+    upload = file.stream
+    try:
+        pages = count_pages(upload.path)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if pages > MAX_UPLOAD_PAGES:
+        return jsonify({"error": f"PDF has {pages} pages (max {MAX_UPLOAD_PAGES})"}), 413
+
+    try:
+        # Closed and handed over; the job deletes it when ingest finishes, fails or is cancelled
+        job_id = ingest_jobs.submit(
+            user["id"], upload.claim(), document_name=file.filename,
+            content_hash=upload.sha256, target_document_id=target_document_id,
+        )
+    except QueueFull:
+        upload.discard()
+        return jsonify({"error": "Server busy, try again shortly"}), 503
+
+    return jsonify({"status": "queued", "job_id": job_id, "file_id": job_id}), 202
+
+
+@app.route("/api/upload/<job_id>", methods=["GET"])
+@require_auth
+def upload_status(user, job_id):
+    status = ingest_jobs.status(user["id"], job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status)
+
+
+@app.route("/api/upload/<job_id>", methods=["DELETE"])
+@require_auth
+def upload_cancel(user, job_id):
+    if not ingest_jobs.cancel(user["id"], job_id):
+        return jsonify({"error": "Job not found or already finished"}), 404
+    return jsonify({"status": "cancelling"})
+
+
 
-    chatpdf.ingest(tmp_path)
+def requested_file_ids(session, data):
+    """(file_ids or None for all files, error message)"""
+    file_ids = data.get("file_ids")
+    if file_ids is None:
+        return None, None
+    if not isinstance(file_ids, list) or not file_ids or not all(isinstance(f, str) for f in file_ids):
+        return None, "file_ids must be a non-empty list"
+    unknown = set(file_ids) - set(session["chatpdf"].vector_index.file_ids)
+    if unknown:
+        return None, f"Unknown file_ids: {', '.join(sorted(unknown))}"
+    return file_ids, None
 
-    return jsonify({"status": "PDF processed"})
 
+@app.route("/api/documents/<document_id>/files", methods=["GET"])
+@require_auth
+def list_files(user, document_id):
+    session = sessions.get(user["id"], document_id)
+    if session is None:
+        return jsonify({"error": "Document not loaded, please upload it again"}), 404
+    return jsonify({"document_id": document_id, "files": session["chatpdf"].files()})
+
+
+@app.route("/api/documents/<document_id>/files/<file_id>", methods=["DELETE"])
+@require_auth
+def remove_file(user, document_id, file_id):
+    session = sessions.get(user["id"], document_id)
+    if session is None:
+        return jsonify({"error": "Document not loaded, please upload it again"}), 404
+    chatpdf = session["chatpdf"]
+    if not chatpdf.remove_document(file_id):
+        return jsonify({"error": "File not found"}), 404
+    sessions.put(user["id"], document_id, chatpdf, document_name=session["document_name"])
+    return jsonify({"status": "removed", "files": chatpdf.files()})
 
 
 @app.route("/api/ask", methods=["POST"])
 @require_auth
 def ask(user):
-   
-    allowed = check_limits(user["id"], "ask")
+    data = request.json or {}
+    question = data.get("question")
+
+    if not question:
+        return jsonify({"error": "Question missing"}), 400
+
+    session = sessions.get(user["id"], data.get("document_id"))
+    if session is None:
+        return jsonify({"error": "Document not loaded, please upload it again"}), 404
+
+    file_ids, error = requested_file_ids(session, data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Charged only once the question can actually be answered
+    with metrics.span("limits"):
+        allowed = check_limits(user["id"], "ask")
     if not allowed:
         return jsonify({"error": "Question limit reached"}), 429
 
+    sources = []
+    try:
+        answer = session["chatpdf"].ask(question, sources=sources, file_ids=file_ids)
+    except LLMBusy:
+        return jsonify({"error": "Too many questions in progress, please retry shortly"}), 503
+    except LLMDeadlineExceeded:
+        return jsonify({"error": "The model took too long to answer"}), 504
+
+    
+    with metrics.span("log_qa"):
+        log_qa(
+            user_id=user["id"],
+            document_name=session["document_name"],
+            question=question,
+            answer=answer,
+            sources=sources
+        )
+
+    return jsonify({"answer": answer})
+
+
+
+@app.route("/api/ask/stream", methods=["POST"])
+@require_auth
+def ask_stream(user):
+    """Server-Sent Events: `token` events with answer text, then one `done` event."""
     data = request.json or {}
     question = data.get("question")
 
     if not question:
         return jsonify({"error": "Question missing"}), 400
 
-    
-    answer = chatpdf.ask(question)
+    session = sessions.get(user["id"], data.get("document_id"))
+    if session is None:
+        return jsonify({"error": "Document not loaded, please upload it again"}), 404
 
-    
-    log_qa(
-        user_id=user["id"],
-        document_name="current_document.pdf",  # replace later
-        question=question,
-        answer=answer,
-        sources=[]  
-    )
+    file_ids, error = requested_file_ids(session, data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    return jsonify({"answer": answer})
+    # Charged only once the question can actually be answered
+    with metrics.span("limits"):
+        allowed = check_limits(user["id"], "ask")
+    if not allowed:
+        return jsonify({"error": "Question limit reached"}), 429
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def generate():
+        pieces = []
+        sources = []
+        try:
+            for piece in session["chatpdf"].ask_stream(question, sources=sources, file_ids=file_ids):
+                pieces.append(piece)
+                yield sse("token", {"text": piece})
+            yield sse("done", {})
+        except LLMBusy:
+            yield sse("error", {"error": "Too many questions in progress, please retry shortly"})
+            return
+        except LLMDeadlineExceeded:
+            yield sse("error", {"error": "The model took too long to answer"})
+            return
+        except Exception as e:
+            app.logger.error(f"Streaming answer failed: {str(e)}")
+            yield sse("error", {"error": "Answer generation failed"})
+            return
+
+        # Once per question, and only for an answer the client received in
+        # full: errors and disconnects (GeneratorExit) never get here
+        with metrics.span("log_qa"):
+            log_qa(
+                user_id=user["id"],
+                document_name=session["document_name"],
+                question=question,
+                answer="".join(pieces),
+                sources=sources
+            )
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 
 @app.route("/api/reset", methods=["POST"])
 @require_auth
 def reset(user):
-    chatpdf.clear()
+    data = request.get_json(silent=True) or {}
+    sessions.remove(user["id"], data.get("document_id"))
     return jsonify({"status": "Session cleared"})
 
 
@@ -110,6 +319,35 @@ def get_limits(user):
 
 
 
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus text format; stage latency histograms plus cache/session gauges for this worker."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+
+    gauges = {}
+    for prefix, stats in (
+        ("rag_sessions", sessions.stats()),
+        ("rag_answer_cache", answer_cache.stats()),
+        ("rag_ingest_cache", ingest_cache.stats()),
+        ("rag_context", context_packer.stats()),
+    ):
+        gauges.update({f"{prefix}_{name}": value for name, value in stats.items()})
+    gauges["rag_qa_log_queue_depth"] = queue_depth()
+    # Only if this worker has loaded the model; a scrape shouldn't load it
+    llm_gateway = loaded_llm_gateway()
+    if llm_gateway is not None:
+        gauges.update({f"rag_llm_{name}": value for name, value in llm_gateway.stats().items()})
+    embedding_service = loaded_embedding_service()
+    if embedding_service is not None:
+        gauges.update({f"rag_embedding_{name}": value for name, value in embedding_service.stats().items()})
+    reranker = loaded_reranker()
+    if reranker is not None:
+        gauges.update({f"rag_rerank_{name}": value for name, value in reranker.stats().items()})
+
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def spa(path):
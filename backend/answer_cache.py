@@ -0,0 +1,150 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from backend.embeddings import normalize_query
+from backend.structure import parse_structure_query
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+# Cosine similarity of normalized query embeddings needed for a semantic hit
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+# Tokens with a digit: clause/page numbers, dates, amounts, "PN-0037"
+_ANCHOR_TOKEN = re.compile(r"[\w./-]*\d[\w./-]*")
+
+
+def query_anchors(query: str):
+    """
+    What a semantic hit must share with the cached question: its digit-
+    bearing tokens and its page/section references. "clause 7" and
+    "clause 8", or "PN-0037" and "PN-0038", embed almost identically but
+    must not share an answer.
+    """
+    tokens = frozenset(token.strip("./-").lower() for token in _ANCHOR_TOKEN.findall(query))
+    references = tuple(sorted((name, tuple(values)) for name, values in parse_structure_query(query).items()))
+    return tokens, references
+
+
+class AnswerCache:
+    """
+    Answers in front of retrieval + LLM, scoped per document key (content
+    hash + ingest parameters of each file, and its name). Re-ingesting or
+    changing the file set gives a new key, so entries never need
+    invalidating; stale ones age out.
+
+    Level 1 is an exact match on the normalized question text. Level 2
+    compares the question's embedding against earlier questions on the same
+    document and hits above `similarity` cosine, but only on a question with
+    the same numbers, identifiers and page/section references
+    (query_anchors). Entries are LRU-bounded and expire after `ttl_seconds`.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._entries = OrderedDict()  # (document_key, normalized query) -> entry dict
+        self._by_document = {}  # document_key -> {"keys": [...], "matrix": ndarray or None}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def lookup(self, document_key, query, embed):
+        """
+        Return the cached answer or None. `embed(query)` is only called when
+        the exact level misses; it should return a normalized vector.
+        """
+        key = (document_key, normalize_query(query))
+        with self._lock:
+            entry = self._live(key)
+            if entry is not None:
+                self.exact_hits += 1
+                return entry["answer"]
+            if document_key not in self._by_document:
+                self.misses += 1
+                return None
+
+        vector = np.asarray(embed(query), dtype=np.float32)
+        anchors = query_anchors(query)
+
+        with self._lock:
+            document = self._by_document.get(document_key)
+            if document and document["keys"]:
+                if document["matrix"] is None:
+                    document["matrix"] = np.stack([self._entries[k]["vector"] for k in document["keys"]])
+                similarities = document["matrix"] @ vector
+                candidates = np.flatnonzero(similarities >= self.similarity)
+                keys = list(document["keys"])  # _live() may drop expired keys
+                for best in candidates[np.argsort(-similarities[candidates], kind="stable")]:
+                    if self._entries.get(keys[best], {}).get("anchors") != anchors:
+                        continue
+                    entry = self._live(keys[best])
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        logger.info(f"Semantic answer cache hit ({similarities[best]:.3f})")
+                        return entry["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, document_key, query, vector, answer):
+        key = (document_key, normalize_query(query))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "answer": answer,
+                "vector": np.asarray(vector, dtype=np.float32),
+                "anchors": query_anchors(query),
+                "created": time.monotonic(),
+            }
+            document = self._by_document.setdefault(document_key, {"keys": [], "matrix": None})
+            document["keys"].append(key)
+            document["matrix"] = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+    def _live(self, key):
+        """Caller holds the lock. Entry if present and not expired (bumped to MRU)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["created"] > self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        """Caller holds the lock."""
+        self._entries.pop(key, None)
+        document = self._by_document.get(key[0])
+        if document is None:
+            return
+        document["keys"].remove(key)
+        document["matrix"] = None
+        if not document["keys"]:
+            del self._by_document[key[0]]
+
+
+answer_cache = AnswerCache()
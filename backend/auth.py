@@ -1,14 +1,149 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
 import jwt
 from jwt import PyJWKClient
 from functools import wraps
 from flask import request, jsonify
 
+from backend import metrics
+
 SUPABASE_PROJECT_URL = "https://uvdgcajudjqizmkupzmr.supabase.co"
 JWKS_URL = f"{SUPABASE_PROJECT_URL}/auth/v1/.well-known/jwks.json"
 ISSUER = f"{SUPABASE_PROJECT_URL}/auth/v1"
 
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+# Unknown kids trigger a refetch at most this often (rotation vs. junk tokens)
+JWKS_MISS_COOLDOWN_SECONDS = float(os.getenv("JWKS_MISS_COOLDOWN_SECONDS", "30"))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Upper bound on how long a verified token is trusted without re-checking the signature
+AUTH_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+
 jwks_client = PyJWKClient(JWKS_URL)
 
+
+class SigningKeys:
+    """
+    kid -> public key, fetched from the JWKS endpoint off the request path.
+    A daemon thread refetches every `refresh_seconds`; a token with an
+    unknown kid (key rotation) refetches synchronously, rate-limited by
+    `miss_cooldown`. A failed refresh keeps serving the previous keys.
+    """
+
+    def __init__(self, client, refresh_seconds=JWKS_REFRESH_SECONDS, miss_cooldown=JWKS_MISS_COOLDOWN_SECONDS):
+        self.client = client
+        self.refresh_seconds = refresh_seconds
+        self.miss_cooldown = miss_cooldown
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._last_fetch = float("-inf")  # monotonic() can be below the cooldown on a fresh host
+        self._refresher_pid = None
+
+    def get(self, kid):
+        self._ensure_refresher()
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        with self._lock:
+            key = self._keys.get(kid)
+            if key is None and time.monotonic() - self._last_fetch >= self.miss_cooldown:
+                self._fetch()
+                key = self._keys.get(kid)
+        if key is None:
+            raise jwt.PyJWKClientError(f"Unable to find a signing key that matches: {kid}")
+        return key
+
+    def _fetch(self):
+        """Caller holds the lock"""
+        self._last_fetch = time.monotonic()
+        jwk_set = self.client.get_jwk_set(refresh=True)
+        # Swap the whole dict so readers never see a partial update
+        self._keys = {jwk.key_id: jwk.key for jwk in jwk_set.keys if jwk.key_id}
+
+    def _ensure_refresher(self):
+        # Per process: gunicorn workers fork after import
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid != os.getpid():
+                self._refresher_pid = os.getpid()
+                threading.Thread(target=self._refresh_loop, name="jwks-refresh", daemon=True).start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                with self._lock:
+                    self._fetch()
+            except Exception as e:
+                print("JWKS refresh failed, keeping cached keys:", repr(e))
+
+
+class TokenCache:
+    """Verified tokens by SHA-256 of the raw token, LRU-bounded, expiring at the token's exp."""
+
+    def __init__(self, max_entries=AUTH_TOKEN_CACHE_SIZE, ttl_seconds=AUTH_TOKEN_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # token hash -> (expires_at, user)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, token, payload, user):
+        key = self.key(token)
+        expires_at = min(payload.get("exp", 0), time.time() + self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+signing_keys = SigningKeys(jwks_client)
+token_cache = TokenCache()
+
+
+def verify_token(token):
+    """User dict for a valid Supabase access token; raises jwt exceptions otherwise."""
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
+    header = jwt.get_unverified_header(token)
+    payload = jwt.decode(
+        token,
+        signing_keys.get(header.get("kid")),
+        algorithms=["ES256"],
+        audience="authenticated",
+        issuer=ISSUER,
+    )
+
+    user = {
+        "id": payload["sub"],
+        "email": payload.get("email"),
+    }
+    token_cache.put(token, payload, user)
+    return user
+
+
 def require_auth(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -20,24 +155,12 @@ def require_auth(fn):
         token = auth_header.split(" ", 1)[1]
 
         try:
-            signing_key = jwks_client.get_signing_key_from_jwt(token).key
-
-            payload = jwt.decode(
-                token,
-                signing_key,
-                algorithms=["ES256"],
-                audience="authenticated",
-                issuer=ISSUER,
-            )
+            with metrics.span("auth"):
+                user = verify_token(token)
         except Exception as e:
             print("JWT verification error:", repr(e))
             return jsonify({"error": "Invalid token"}), 401
 
-        user = {
-            "id": payload["sub"],
-            "email": payload.get("email"),
-        }
-
-        return fn(user, *args, **kwargs)
+        return fn(dict(user), *args, **kwargs)
 
     return wrapper
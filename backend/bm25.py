@@ -0,0 +1,192 @@
+import logging
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+def default_preprocess(text: str):
+    # Same tokenization as BM25Retriever's default_preprocessing_func
+    return text.split()
+
+
+class BM25Index:
+    """
+    Okapi BM25 keyword index, built from one or more segments (one per file).
+
+    Scores match rank_bm25.BM25Okapi (what BM25Retriever uses) over the union
+    of all segments. Each segment keeps a sparse doc x term count matrix;
+    corpus statistics (doc frequencies, total length) are running sums, and
+    the BM25 weights are computed at query time for the query's columns
+    only. So add() tokenizes just the new documents and remove() subtracts
+    one segment's counts; neither touches the other segments.
+    """
+
+    def __init__(self, documents=(), k1=1.5, b=0.75, epsilon=0.25, preprocess_func=default_preprocess, key=None):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.preprocess_func = preprocess_func
+        self.vocab = {}
+        self.documents = []
+        self._segments = []  # {"key", "documents", "tf": csc (n_docs, n_terms at build), "doc_len"}
+        self._doc_freq = np.zeros(0, dtype=np.float64)
+        self._total_len = 0.0
+        self._idf = None
+        documents = list(documents)
+        if documents:
+            self.add(documents, key=key)
+
+    def copy(self):
+        """
+        A new index sharing this one's (never modified) segments: add() and
+        remove() on the copy leave this index untouched for its readers.
+        """
+        other = object.__new__(BM25Index)
+        other.__dict__.update(self.__dict__)
+        other.vocab = dict(self.vocab)
+        other.documents = list(self.documents)
+        other._segments = list(self._segments)
+        other._doc_freq = self._doc_freq.copy()
+        return other
+
+    def add(self, documents, key=None):
+        """Append a segment; its documents get the next positions."""
+        documents = list(documents)
+        rows, cols, counts = [], [], []
+        doc_len = np.zeros(len(documents), dtype=np.float64)
+
+        for row, doc in enumerate(documents):
+            tokens = self.preprocess_func(doc.page_content)
+            doc_len[row] = len(tokens)
+            term_counts = {}
+            for token in tokens:
+                term_id = self.vocab.setdefault(token, len(self.vocab))
+                term_counts[term_id] = term_counts.get(term_id, 0) + 1
+            rows.extend([row] * len(term_counts))
+            cols.extend(term_counts.keys())
+            counts.extend(term_counts.values())
+
+        n_terms = len(self.vocab)
+        tf = sparse.csc_matrix(
+            (np.asarray(counts, dtype=np.float64), (rows, cols)),
+            shape=(len(documents), n_terms),
+        )
+        tf.sort_indices()
+
+        doc_freq = np.zeros(n_terms, dtype=np.float64)
+        doc_freq[:len(self._doc_freq)] = self._doc_freq
+        doc_freq += np.diff(tf.indptr)
+        self._doc_freq = doc_freq
+        self._total_len += doc_len.sum()
+        self._segments.append({"key": key, "documents": documents, "tf": tf, "doc_len": doc_len})
+        self.documents.extend(documents)
+        self._idf = None
+        logger.info(f"BM25 segment added: {len(documents)} docs, index now {len(self.documents)} docs, {n_terms} terms")
+
+    def remove(self, key) -> bool:
+        """Drop the segment added under `key`; later documents move up."""
+        for i, segment in enumerate(self._segments):
+            if segment["key"] == key:
+                break
+        else:
+            return False
+        tf = segment["tf"]
+        self._doc_freq[:tf.shape[1]] -= np.diff(tf.indptr)
+        self._total_len -= segment["doc_len"].sum()
+        del self._segments[i]
+        self.documents = [doc for segment in self._segments for doc in segment["documents"]]
+        self._idf = None
+        return True
+
+    def _get_idf(self):
+        # idf as in BM25Okapi: negative idfs are floored to epsilon * mean idf
+        # (terms whose documents were all removed don't count)
+        if self._idf is None:
+            n_docs = len(self.documents)
+            present = self._doc_freq > 0
+            idf = np.log(n_docs - self._doc_freq + 0.5) - np.log(self._doc_freq + 0.5)
+            if present.any():
+                idf[present & (idf < 0)] = self.epsilon * idf[present].mean()
+            self._idf = idf
+        return self._idf
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def nbytes(self):
+        """Approximate size of the scoring structures (excluding documents)"""
+        total = self._doc_freq.nbytes
+        for segment in self._segments:
+            tf = segment["tf"]
+            total += tf.data.nbytes + tf.indices.nbytes + tf.indptr.nbytes + segment["doc_len"].nbytes
+        return total
+
+    def positions(self, keys) -> np.ndarray:
+        """Positions of the documents in the segments added under `keys`"""
+        keys = set(keys)
+        out, offset = [], 0
+        for segment in self._segments:
+            n = len(segment["documents"])
+            if segment["key"] in keys:
+                out.append(np.arange(offset, offset + n))
+            offset += n
+        return np.concatenate(out) if out else np.empty(0, dtype=np.int64)
+
+    def get_scores(self, query: str, keys=None) -> np.ndarray:
+        """BM25 score of every document for the query (0 outside `keys` segments, if given)."""
+        scores = np.zeros(len(self.documents))
+        term_ids = {}
+        for token in self.preprocess_func(query):
+            term_id = self.vocab.get(token)
+            if term_id is not None:
+                term_ids[term_id] = term_ids.get(term_id, 0) + 1
+
+        if not term_ids or not len(self.documents):
+            return scores
+
+        cols = np.fromiter(term_ids.keys(), dtype=np.int64)
+        query_weights = np.fromiter(term_ids.values(), dtype=np.float64) * self._get_idf()[cols]
+        avgdl = self._total_len / len(self.documents)
+        keys = set(keys) if keys is not None else None
+
+        offset = 0
+        for segment in self._segments:
+            tf, n = segment["tf"], len(segment["documents"])
+            known = cols < tf.shape[1]
+            if known.any() and (keys is None or segment["key"] in keys):
+                sub = tf[:, cols[known]]
+                term = np.repeat(np.arange(sub.shape[1]), np.diff(sub.indptr))
+                # weight = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+                dl = segment["doc_len"][sub.indices]
+                norm = self.k1 * (1 - self.b + self.b * dl / avgdl) if avgdl else self.k1
+                weights = sub.data * (self.k1 + 1) / (sub.data + norm) * query_weights[known][term]
+                scores[offset:offset + n] = np.bincount(sub.indices, weights=weights, minlength=n)
+            offset += n
+        return scores
+
+    def top_k(self, query: str, k: int, keys=None):
+        """Return (indices, scores) of the k best documents, best first (within `keys` segments, if given)."""
+        scores = self.get_scores(query, keys)
+        if keys is not None:
+            allowed = self.positions(keys)
+            candidates, scores = allowed, scores[allowed]
+        else:
+            candidates = None
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if candidates is not None:
+            return candidates[top], scores[top]
+        return top, scores[top]
+
+    def search(self, query: str, k: int, keys=None):
+        """Return the k best documents for the query."""
+        indices, _ = self.top_k(query, k, keys)
+        return [self.documents[i] for i in indices]
+
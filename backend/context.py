@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+# No tokenizer for the chat model here; ~4 characters per token for English text
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+# Shortest shared run of text treated as chunk overlap rather than coincidence
+MIN_OVERLAP_CHARS = 50
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CONTEXT_CHARS_PER_TOKEN) + 1 if text else 0
+
+
+def pin_cite(metadata: dict) -> str:
+    start = metadata.get("page_start", metadata.get("page_number"))
+    end = metadata.get("page_end") or start
+    if start is None:
+        cite = "p. ?"
+    else:
+        cite = f"p. {start}" if end == start else f"pp. {start}-{end}"
+    # Name the document when several are loaded into one session
+    source = metadata.get("source")
+    return f"[{source}, {cite}]" if source else f"[{cite}]"
+
+
+def block_header(metadata: dict) -> str:
+    """Pin-cite plus the chunk's section heading, when ingest recorded one"""
+    section = metadata.get("section")
+    return f"{pin_cite(metadata)} {section}" if section else pin_cite(metadata)
+
+
+def trim_overlap(text: str, kept: str) -> str:
+    """
+    `text` without the part it shares with `kept`: chunk_by_title repeats the
+    tail of one chunk at the head of the next (overlap), so a chunk's prefix
+    can be a suffix of a neighbour, or its suffix a prefix of one.
+    Returns "" when `text` is entirely inside `kept`.
+    """
+    if text in kept:
+        return ""
+    if len(text) < MIN_OVERLAP_CHARS or len(kept) < MIN_OVERLAP_CHARS:
+        return text
+
+    # kept ends with text's head
+    start = kept.find(text[:MIN_OVERLAP_CHARS])
+    while start != -1:
+        if text.startswith(kept[start:]):
+            text = text[len(kept) - start:]
+            break
+        start = kept.find(text[:MIN_OVERLAP_CHARS], start + 1)
+
+    # text ends with kept's head
+    if len(text) >= MIN_OVERLAP_CHARS:
+        end = text.rfind(kept[:MIN_OVERLAP_CHARS])
+        while end != -1:
+            if kept.startswith(text[end:]):
+                text = text[:end]
+                break
+            end = text.rfind(kept[:MIN_OVERLAP_CHARS], 0, end)
+    return text
+
+
+def is_neighbour(a: dict, b: dict) -> bool:
+    """Chunks that can overlap: same file, same or adjacent page"""
+    if a.get("file_id", a.get("filename")) != b.get("file_id", b.get("filename")):
+        return False
+    page_a, page_b = a.get("page_number"), b.get("page_number")
+    return page_a is None or page_b is None or abs(page_a - page_b) <= 1
+
+
+class ContextPacker:
+    """
+    Builds the prompt context from fused retrieval results: best-scored
+    chunks first, overlap with already packed neighbours removed, each block
+    headed with a page pin-cite (and section heading), stopping at `token_budget`. Keeps running
+    totals of tokens saved against plain concatenation.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.raw_tokens = 0
+        self.packed_tokens = 0
+
+    def pack(self, documents, scores, token_budget=None) -> dict:
+        """
+        Returns {"context", "documents", "scores", "tokens", "raw_tokens",
+        "tokens_saved", "deduplicated", "dropped"}; "documents"/"scores" are
+        the chunks that made it into the context.
+        """
+        budget = token_budget or self.token_budget
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+
+        blocks, used, used_scores = [], [], []
+        tokens = deduplicated = dropped = 0
+        for i in order:
+            doc = documents[i]
+            text = doc.page_content.strip()
+            for kept_doc, kept_text in zip(used, blocks):
+                if text and is_neighbour(doc.metadata, kept_doc.metadata):
+                    text = trim_overlap(text, kept_text).strip()
+            if len(text) < len(doc.page_content.strip()):
+                deduplicated += 1
+            if not text:
+                continue
+
+            block_tokens = estimate_tokens(text) + estimate_tokens(block_header(doc.metadata)) + 1
+            if tokens + block_tokens > budget:
+                dropped += 1
+                continue
+            blocks.append(text)
+            used.append(doc)
+            used_scores.append(scores[i])
+            tokens += block_tokens
+
+        context = "\n\n".join(f"{block_header(doc.metadata)}\n{text}" for doc, text in zip(used, blocks))
+        raw_tokens = estimate_tokens("\n\n".join(doc.page_content for doc in documents))
+        with self._lock:
+            self.queries += 1
+            self.raw_tokens += raw_tokens
+            self.packed_tokens += tokens
+
+        return {
+            "context": context,
+            "documents": used,
+            "scores": used_scores,
+            "tokens": tokens,
+            "raw_tokens": raw_tokens,
+            "tokens_saved": max(raw_tokens - tokens, 0),
+            "deduplicated": deduplicated,
+            "dropped": dropped,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "raw_tokens": self.raw_tokens,
+                "packed_tokens": self.packed_tokens,
+                "tokens_saved": max(self.raw_tokens - self.packed_tokens, 0),
+            }
+
+
+context_packer = ContextPacker()
@@ -0,0 +1,165 @@
+import logging
+
+import numpy as np
+
+from langchain_core.documents import Document
+
+from backend.structure import StructureIndex
+
+logger = logging.getLogger(__name__)
+
+
+class CorpusIndex:
+    """
+    Several documents' VectorIndexes searched as one.
+
+    Each added file is a segment: its own (memory-mapped) VectorIndex plus
+    copies of its chunks tagged with `file_id` and `source` (the document
+    name), and a StructureIndex over their page/section metadata.
+    Positions are global, in the order files were added, which is also the
+    order of the BM25Index segments built over the same chunks.
+    Adding or removing a file never touches the other files' vectors:
+    cost is the new file's size, not the corpus size.
+
+    Duck-types VectorIndex (documents, search, vectors, dtype,
+    resident_bytes) for HybridRetriever.
+    """
+
+    def __init__(self):
+        self._segments = []  # {"file_id", "name", "index", "documents", "structure"}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self.documents = []
+
+    def __len__(self):
+        return len(self.documents)
+
+    def copy(self):
+        """A new corpus sharing this one's segments; changing it leaves this one as is"""
+        other = CorpusIndex()
+        other._segments = list(self._segments)
+        other._reindex()
+        return other
+
+    def add(self, file_id, vector_index, name=None):
+        """Append a file; returns its chunks (with file_id/source metadata)."""
+        if any(segment["file_id"] == file_id for segment in self._segments):
+            raise ValueError(f"File {file_id} is already in the index")
+        documents = []
+        for doc in vector_index.documents:
+            metadata = dict(doc.metadata, file_id=file_id)
+            if name:
+                metadata["source"] = name
+            documents.append(Document(page_content=doc.page_content, metadata=metadata))
+        self._segments.append({
+            "file_id": file_id,
+            "name": name,
+            "index": vector_index,
+            "documents": documents,
+            "structure": StructureIndex(documents),
+        })
+        self._reindex()
+        logger.info(f"Added {name or file_id} to corpus: {len(documents)} chunks, {len(self._segments)} files")
+        return documents
+
+    def remove(self, file_id) -> bool:
+        before = len(self._segments)
+        self._segments = [segment for segment in self._segments if segment["file_id"] != file_id]
+        if len(self._segments) == before:
+            return False
+        self._reindex()
+        return True
+
+    def _reindex(self):
+        sizes = [len(segment["documents"]) for segment in self._segments]
+        self._offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+        self.documents = [doc for segment in self._segments for doc in segment["documents"]]
+
+    @property
+    def file_ids(self):
+        return [segment["file_id"] for segment in self._segments]
+
+    def files(self):
+        return [
+            {"file_id": segment["file_id"], "name": segment["name"], "chunks": len(segment["documents"])}
+            for segment in self._segments
+        ]
+
+    @property
+    def indexes(self):
+        return [segment["index"] for segment in self._segments]
+
+    @property
+    def dtype(self) -> str:
+        dtypes = {segment["index"].dtype for segment in self._segments}
+        return dtypes.pop() if len(dtypes) == 1 else ",".join(sorted(dtypes))
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(segment["index"].resident_bytes for segment in self._segments)
+
+    @property
+    def structure_bytes(self) -> int:
+        return sum(segment["structure"].nbytes for segment in self._segments)
+
+    def select(self, file_ids=None, pages=None, sections=None, element_types=None):
+        """
+        Global positions of the chunks matching the structure filters (see
+        StructureIndex.select), in all files or only `file_ids`; None when
+        no filter is given.
+        """
+        if not (pages or sections or element_types):
+            return None
+        wanted = set(file_ids) if file_ids is not None else None
+        out = []
+        for segment, offset in zip(self._segments, self._offsets):
+            if wanted is not None and segment["file_id"] not in wanted:
+                continue
+            out.append(segment["structure"].select(pages, sections, element_types) + offset)
+        return np.concatenate(out) if out else np.empty(0, dtype=np.int64)
+
+    def search(self, query_vector, k: int, file_ids=None, positions=None):
+        """
+        Return (positions, scores) of the k most similar chunks, best first,
+        across all files or only `file_ids`. Each file returns its own top-k
+        and those are merged, so no corpus-wide score array is built.
+        With `positions` (e.g. from select()) only those chunks are scored.
+        """
+        if positions is not None:
+            return self._search_positions(query_vector, k, positions)
+        wanted = set(file_ids) if file_ids is not None else None
+        positions, scores = [], []
+        for segment, offset in zip(self._segments, self._offsets):
+            if wanted is not None and segment["file_id"] not in wanted:
+                continue
+            top, top_scores = segment["index"].search(query_vector, k)
+            positions.append(top + offset)
+            scores.append(top_scores)
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        positions, scores = np.concatenate(positions), np.concatenate(scores)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return positions[order], scores[order]
+
+    def _search_positions(self, query_vector, k: int, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return positions, np.empty(0, dtype=np.float32)
+        scores = self.vectors(positions) @ np.asarray(query_vector, dtype=np.float32)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return positions[top], scores[top]
+
+    def vectors(self, positions) -> np.ndarray:
+        """Dequantized float32 rows for global positions"""
+        positions = np.asarray(positions, dtype=np.int64)
+        segment_of = np.searchsorted(self._offsets, positions, side="right") - 1
+        out = None
+        for s in np.unique(segment_of):
+            mask = segment_of == s
+            rows = self._segments[s]["index"].vectors(positions[mask] - self._offsets[s])
+            if out is None:
+                out = np.empty((len(positions), rows.shape[1]), dtype=np.float32)
+            out[mask] = rows
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+EMBEDDING_DIM = 768  # all-mpnet-base-v2
+EMBEDDING_MAX_SEQ_LENGTH = 384  # all-mpnet-base-v2
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_QUERY_CACHE_SIZE = int(os.getenv("EMBEDDING_QUERY_CACHE_SIZE", "2048"))
+# "torch" (sentence-transformers) or "onnx" (onnxruntime on an exported model)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH")
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))  # 0 = onnxruntime default
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class EmbeddingService(Embeddings):
+    """
+    Process-wide embedding model: weights are loaded once, documents are
+    encoded in batches of `batch_size`, and query vectors are kept in an LRU
+    keyed by normalized query text. Implements langchain's Embeddings so it
+    can be passed anywhere HuggingFaceEmbeddings was.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE,
+                 backend=EMBEDDING_BACKEND, onnx_path=EMBEDDING_ONNX_PATH,
+                 query_cache_size=EMBEDDING_QUERY_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+
+        if backend == "onnx" and not onnx_path:
+            logger.warning("EMBEDDING_BACKEND=onnx but EMBEDDING_ONNX_PATH not set, using torch")
+            backend = "torch"
+        self.backend = backend
+
+        if backend == "onnx":
+            import onnxruntime
+            from transformers import AutoTokenizer
+
+            options = onnxruntime.SessionOptions()
+            if EMBEDDING_ONNX_THREADS:
+                options.intra_op_num_threads = EMBEDDING_ONNX_THREADS
+            self._session = onnxruntime.InferenceSession(
+                onnx_path, options, providers=["CPUExecutionProvider"]
+            )
+            self._input_names = {i.name for i in self._session.get_inputs()}
+            self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+        else:
+            from sentence_transformers import SentenceTransformer
+
+            self._model = SentenceTransformer(model_name)
+        logger.info(f"Embedding model loaded: {model_name} ({self.backend}, batch_size={batch_size})")
+
+    @property
+    def cache_tag(self) -> str:
+        """Identifies the vectors this service produces; part of the ingest cache key"""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}+onnx"
+
+    def encode(self, texts) -> np.ndarray:
+        """(len(texts), dim) float32, L2-normalized"""
+        # Same preprocessing as HuggingFaceEmbeddings, so cached vectors stay valid
+        texts = [text.replace("\n", " ") for text in texts]
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        if self.backend == "onnx":
+            return self._encode_onnx(texts)
+        return np.asarray(
+            self._model.encode(texts, batch_size=self.batch_size, show_progress_bar=False),
+            dtype=np.float32,
+        )
+
+    def _encode_onnx(self, texts) -> np.ndarray:
+        # Length-sorted batches keep padding (wasted compute) small
+        order = np.argsort([len(text) for text in texts])
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            positions = order[start:start + self.batch_size]
+            tokens = self._tokenizer(
+                [texts[i] for i in positions],
+                padding=True,
+                truncation=True,
+                max_length=EMBEDDING_MAX_SEQ_LENGTH,
+                return_tensors="np",
+            )
+            feed = {name: value.astype(np.int64) for name, value in tokens.items() if name in self._input_names}
+            hidden = self._session.run(None, feed)[0]
+
+            # Mean pooling over real tokens, then normalize (the model's own pipeline)
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors[positions] = pooled
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query_vector(self, text: str) -> np.ndarray:
+        key = normalize_query(text)
+        with self._cache_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.query_cache_hits += 1
+                return vector
+            self.query_cache_misses += 1
+
+        # Encode the normalized text so every variant maps to the same vector
+        vector = self.encode([key])[0]
+        vector.setflags(write=False)  # shared between callers
+        with self._cache_lock:
+            self._query_cache[key] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def embed_query(self, text: str):
+        return self.embed_query_vector(text).tolist()
+
+    def stats(self) -> dict:
+        with self._cache_lock:
+            return {
+                "backend": self.backend,
+                "query_cache_size": len(self._query_cache),
+                "query_cache_hits": self.query_cache_hits,
+                "query_cache_misses": self.query_cache_misses,
+            }
+
+
+def get_embedding_service() -> EmbeddingService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
+
+
+def loaded_embedding_service():
+    """The service if this process has loaded it, else None (never loads the model)"""
+    return _service
@@ -0,0 +1,121 @@
+"""
+In-process stand-in for the supabase client, for running the app and
+benchmarks without a Supabase project (SUPABASE_FAKE=1).
+
+Covers only what the backend uses: table(...).select/insert/update/eq/
+single/execute and rpc("check_and_increment_usage", ...), with the RPC
+implemented under a lock so it is atomic like the SQL function.
+"""
+import threading
+from datetime import date
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.operation = "select"
+        self.payload = None
+        self.filters = []
+        self.single_row = False
+
+    def select(self, *columns):
+        self.operation = "select"
+        return self
+
+    def insert(self, payload):
+        self.operation = "insert"
+        self.payload = payload
+        return self
+
+    def update(self, payload):
+        self.operation = "update"
+        self.payload = payload
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def execute(self):
+        with self.client.lock:
+            rows = self.client.tables.setdefault(self.table, [])
+            if self.operation == "insert":
+                new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                rows.extend(dict(row) for row in new_rows)
+                return FakeResponse([dict(row) for row in new_rows])
+
+            matched = [row for row in rows if all(row.get(c) == v for c, v in self.filters)]
+            if self.operation == "update":
+                for row in matched:
+                    row.update(self.payload)
+
+            data = [dict(row) for row in matched]
+            if self.single_row:
+                if len(data) != 1:
+                    raise ValueError(f"Expected one row from {self.table}, got {len(data)}")
+                return FakeResponse(data[0])
+            return FakeResponse(data)
+
+
+class FakeRpc:
+    def __init__(self, fn, params):
+        self.fn = fn
+        self.params = params
+
+    def execute(self):
+        return FakeResponse(self.fn(**self.params))
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables = {}
+        self.lock = threading.RLock()
+        self.rpc_calls = 0
+        self.functions = {"check_and_increment_usage": self._check_and_increment_usage}
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        self.rpc_calls += 1
+        return FakeRpc(self.functions[name], params)
+
+    def _check_and_increment_usage(self, p_user_id, p_action, p_max_questions, p_max_uploads):
+        # Mirrors supabase/migrations/*_check_and_increment_usage.sql
+        today = date.today().isoformat()
+        with self.lock:
+            rows = self.tables.setdefault("usage_limits", [])
+            row = next((r for r in rows if r["user_id"] == p_user_id), None)
+            if row is None:
+                row = {"user_id": p_user_id, "questions_used": 0, "uploads_used": 0, "last_reset": today}
+                rows.append(row)
+
+            if row["last_reset"] != today:
+                row.update(questions_used=0, uploads_used=0, last_reset=today)
+
+            allowed = True
+            if p_action == "ask":
+                allowed = row["questions_used"] < p_max_questions
+                if allowed:
+                    row["questions_used"] += 1
+            elif p_action == "upload":
+                allowed = row["uploads_used"] < p_max_uploads
+                if allowed:
+                    row["uploads_used"] += 1
+
+            return [{
+                "allowed": allowed,
+                "questions_used": row["questions_used"],
+                "uploads_used": row["uploads_used"],
+                "last_reset": row["last_reset"],
+            }]
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from backend.vector_index import VectorIndex, VECTOR_INDEX_DTYPE, quantize
+
+logger = logging.getLogger(__name__)
+
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR", os.path.join(tempfile.gettempdir(), "rag_ingest_cache"))
+INGEST_CACHE_MAX_MB = int(os.getenv("INGEST_CACHE_MAX_MB", "2048"))
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestCache:
+    """
+    On-disk cache of processed chunks + embedding matrix, keyed by the PDF's
+    SHA-256 and every parameter that affects the output. Each entry is a
+    saved VectorIndex, so a hit is just a memory map of the existing files.
+    Entries are written atomically; least recently used entries are deleted
+    once the cache grows past `max_bytes` (live memory maps stay valid).
+    """
+
+    def __init__(self, cache_dir=INGEST_CACHE_DIR, max_bytes=INGEST_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash: str, params: dict) -> str:
+        payload = json.dumps({"sha256": content_hash, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str):
+        """Return the entry's memory-mapped VectorIndex, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        try:
+            index = VectorIndex.load(entry_dir)
+            os.utime(entry_dir)  # mark as recently used for eviction
+        except (FileNotFoundError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return index
+
+    def put(self, key: str, documents, vectors):
+        """
+        Store and return the (memory-mapped) VectorIndex. If the entry can't
+        be written, an in-memory index is returned so ingest still succeeds.
+        """
+        try:
+            index = VectorIndex.save(self._entry_dir(key), documents, vectors)
+        except OSError:
+            # Another worker stored the same key first, or the disk is full
+            try:
+                return VectorIndex.load(self._entry_dir(key))
+            except (FileNotFoundError, ValueError, OSError):
+                logger.warning(f"Could not store ingest cache entry {key}")
+                matrix, scales = quantize(vectors, VECTOR_INDEX_DTYPE)
+                return VectorIndex(documents, matrix, scales)
+        self._evict()
+        return index
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".tmp-") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, path))
+            except FileNotFoundError:
+                continue
+            total += size
+
+        entries.sort()
+        while total > self.max_bytes and len(entries) > 1:
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+            logger.info(f"Ingest cache evicted {os.path.basename(path)}")
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def merge(self, counters: dict):
+        """Add counts from lookups another process made (the ingest pool), so this process's stats cover them"""
+        with self._lock:
+            self.hits += counters.get("hits", 0)
+            self.misses += counters.get("misses", 0)
+            self.evictions += counters.get("evictions", 0)
+
+    def stats(self) -> dict:
+        counters = self.counters()
+        lookups = counters["hits"] + counters["misses"]
+        return dict(counters, hit_rate=counters["hits"] / lookups if lookups else 0.0)
+
+
+ingest_cache = IngestCache()
@@ -0,0 +1,212 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+
+from backend.ingest_cache import ingest_cache
+from backend.rag import prepare_document
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "8"))
+INGEST_JOB_TTL_SECONDS = int(os.getenv("INGEST_JOB_TTL_SECONDS", "3600"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _run_prepare(job_id, pdf_file_path, content_hash, progress_table):
+    """
+    Runs in a pool process; progress goes through a Manager dict. Returns
+    the VectorIndex and this job's ingest cache hits/misses/evictions, which
+    would otherwise only be counted in the pool process.
+    """
+    def progress(stage, percent):
+        state = progress_table.get(job_id, {})
+        if state.get("cancel_requested"):
+            raise JobCancelled(job_id)
+        # Manager dict proxies only see re-assignment, not in-place edits
+        progress_table[job_id] = dict(state, stage=stage, percent=percent)
+
+    before = ingest_cache.counters()
+    vector_index = prepare_document(pdf_file_path, content_hash, progress=progress)
+    after = ingest_cache.counters()
+    return vector_index, {name: after[name] - before[name] for name in after}
+
+
+class IngestJobs:
+    """
+    Bounded background ingestion.
+
+    partition/chunk/embed run in a process pool (layout inference and
+    tokenization don't hold this process's GIL); the resulting VectorIndex
+    is handed to `on_ready(job, vector_index)` in this process, on a thread
+    of its own (not the pool's result thread, which would stall every other
+    job while the ChatPDF and its BM25 index are built), which builds the
+    ChatPDF around it, or adds the file to the session named by the
+    job's `target_document_id`. The job id doubles as the file id. Jobs are
+    visible only to the user that submitted them. With a `registry`, each
+    job's state is also written on submit and on finish, so other workers
+    (and this one after a restart) can report it.
+    """
+
+    def __init__(self, on_ready, workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING, registry=None):
+        self.on_ready = on_ready
+        self.registry = registry
+        self._last_registry_prune = 0.0
+        self.workers = workers
+        self.max_pending = max_pending
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+        self._progress = None
+        self._finisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-ready")
+
+    def _ensure_pool(self):
+        # Started lazily so each gunicorn worker gets its own pool after fork.
+        # spawn, not fork: forking a process that already loaded torch can deadlock.
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            self._manager = context.Manager()
+            self._progress = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def submit(self, user_id, pdf_file_path, document_name=None, content_hash=None, target_document_id=None):
+        with self._lock:
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if job["state"] in ("queued", "running", "cancelling"))
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} ingest jobs pending")
+
+            self._ensure_pool()
+            job_id = uuid.uuid4().hex
+            job = {
+                "id": job_id,
+                "user_id": user_id,
+                "document_name": document_name,
+                "path": pdf_file_path,
+                "state": "queued",
+                "stage": "queued",
+                "percent": 0,
+                "target_document_id": target_document_id,
+                "document_id": None,
+                "file_id": job_id,
+                "error": None,
+                "created": time.monotonic(),
+                "finished": None,
+                # The pool this job runs on, so a crash only resets that pool
+                "executor": self._executor,
+                "progress": self._progress,
+            }
+            self._progress[job_id] = {"stage": "queued", "percent": 0}
+            job["future"] = self._executor.submit(
+                _run_prepare, job_id, pdf_file_path, content_hash, self._progress
+            )
+            self._jobs[job_id] = job
+
+        if self.registry is not None:
+            self.registry.put_job(user_id, job)
+        job["future"].add_done_callback(lambda future: self._finisher.submit(self._finish, job, future))
+        logger.info(f"Ingest job {job_id} queued for user {user_id}")
+        return job_id
+
+    def status(self, user_id, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                # Submitted through another worker, or before a restart
+                return self.registry.get_job(user_id, job_id) if self.registry is not None else None
+            if job["user_id"] != user_id:
+                return None
+            if job["state"] == "queued" and job["future"].running():
+                job["state"] = "running"
+            if job["state"] == "running":
+                live = self._progress_of(job)
+                job["stage"] = live.get("stage", job["stage"])
+                job["percent"] = live.get("percent", job["percent"])
+            return {key: job[key] for key in ("id", "state", "stage", "percent", "document_id", "file_id", "error")}
+
+    def cancel(self, user_id, job_id):
+        """Cancel a queued job outright, or ask a running one to stop at its next stage."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["user_id"] != user_id:
+                return False
+            if job["state"] not in ("queued", "running"):
+                return False
+            # A queued future cancels immediately (its callback marks it cancelled)
+            if not job["future"].cancel():
+                job["progress"][job_id] = dict(self._progress_of(job), cancel_requested=True)
+                job["state"] = "cancelling"
+            return True
+
+    def _finish(self, job, future):
+        try:
+            # The index pickles as its directory, so this is a memory-map reopen
+            vector_index, cache_counters = future.result()
+            ingest_cache.merge(cache_counters)
+            job["stage"], job["percent"] = "indexing", 95
+            job["document_id"] = self.on_ready(job, vector_index)
+            job["state"], job["stage"], job["percent"] = "done", "done", 100
+            logger.info(f"Ingest job {job['id']} done: {len(vector_index)} chunks")
+        except (CancelledError, JobCancelled):
+            job["state"], job["stage"] = "cancelled", "cancelled"
+            logger.info(f"Ingest job {job['id']} cancelled")
+        except BrokenProcessPool as e:
+            # A pool process died (e.g. OOM on a huge PDF); start a fresh pool next submit
+            job["state"], job["stage"], job["error"] = "failed", "failed", "ingest worker crashed"
+            logger.error(f"Ingest job {job['id']} failed: {str(e)}")
+            self._reset_pool(job["executor"])
+        except Exception as e:
+            job["state"], job["stage"], job["error"] = "failed", "failed", str(e)
+            logger.error(f"Ingest job {job['id']} failed: {str(e)}")
+        finally:
+            job["finished"] = time.monotonic()
+            if self.registry is not None:
+                self.registry.put_job(job["user_id"], job)
+            try:
+                job["progress"].pop(job["id"], None)
+            except Exception:
+                pass  # the manager went down with a crashed pool
+            try:
+                os.remove(job["path"])
+            except OSError:
+                pass
+
+    def _progress_of(self, job):
+        try:
+            return job["progress"].get(job["id"], {})
+        except Exception:
+            return {}
+
+    def _reset_pool(self, executor):
+        """Shut down a broken pool and its Manager; the next submit starts fresh ones."""
+        with self._lock:
+            if self._executor is not executor:
+                return  # another job of the same pool already reset it
+            manager = self._manager
+            self._executor = self._manager = self._progress = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+    def _prune(self):
+        """Caller holds the lock. Forget finished jobs after INGEST_JOB_TTL_SECONDS."""
+        now = time.monotonic()
+        if self.registry is not None and now - self._last_registry_prune > 60:
+            self._last_registry_prune = now
+            self.registry.prune_jobs(INGEST_JOB_TTL_SECONDS)
+        for job_id, job in list(self._jobs.items()):
+            if job["finished"] is not None and now - job["finished"] > INGEST_JOB_TTL_SECONDS:
+                del self._jobs[job_id]
@@ -33,90 +33,63 @@
 #     return MAX_QUESTIONS
 
 
-from backend.supabase_client import supabase
+import os
+import threading
+import time
 from datetime import date
 
+from backend.supabase_client import supabase
+
 MAX_QUESTIONS = 50
 MAX_UPLOADS = 15
 
+# get_user_limits is polled by the UI; counters are served from here for a
+# short while. check_limits always goes to the database and refreshes it.
+LIMITS_CACHE_TTL_SECONDS = float(os.getenv("LIMITS_CACHE_TTL_SECONDS", "30"))
 
-def ensure_user_row(user_id):
-    res = supabase.table("usage_limits") \
-        .select("*") \
-        .eq("user_id", user_id) \
-        .execute()
-
-    if not res.data:
-        supabase.table("usage_limits").insert({
-            "user_id": user_id,
-            "questions_used": 0,
-            "uploads_used": 0,
-            "last_reset": date.today().isoformat()
-        }).execute()
+LIMITS_CACHE_MAX_USERS = 10000
 
+_limits_cache = {}  # user_id -> (expires_at, row)
+_limits_cache_lock = threading.Lock()
 
-def reset_if_new_day(row, user_id):
-    today = date.today().isoformat()
 
-    if row["last_reset"] != today:
-        supabase.table("usage_limits").update({
-            "questions_used": 0,
-            "uploads_used": 0,
-            "last_reset": today
-        }).eq("user_id", user_id).execute()
+def check_and_increment(user_id, action):
+    """
+    One atomic round trip (see supabase/migrations/*_check_and_increment_usage.sql):
+    creates the row if missing, applies the daily reset, and increments the
+    counter for `action` only if it is under the limit. action "peek" just
+    reads. Returns {"allowed", "questions_used", "uploads_used", "last_reset"}.
+    """
+    res = supabase.rpc("check_and_increment_usage", {
+        "p_user_id": user_id,
+        "p_action": action,
+        "p_max_questions": MAX_QUESTIONS,
+        "p_max_uploads": MAX_UPLOADS,
+    }).execute()
 
-        row["questions_used"] = 0
-        row["uploads_used"] = 0
-        row["last_reset"] = today
+    row = res.data[0] if isinstance(res.data, list) else res.data
 
+    with _limits_cache_lock:
+        if len(_limits_cache) >= LIMITS_CACHE_MAX_USERS:
+            _limits_cache.clear()
+        _limits_cache[user_id] = (time.monotonic() + LIMITS_CACHE_TTL_SECONDS, row)
     return row
 
 
 def check_limits(user_id, action):
-    ensure_user_row(user_id)
-
-    row = supabase.table("usage_limits") \
-        .select("*") \
-        .eq("user_id", user_id) \
-        .single() \
-        .execute() \
-        .data
-
-    row = reset_if_new_day(row, user_id)
-
-    if action == "ask":
-        if row["questions_used"] >= MAX_QUESTIONS:
-            return False
-
-        supabase.table("usage_limits").update({
-            "questions_used": row["questions_used"] + 1
-        }).eq("user_id", user_id).execute()
-
-    if action == "upload":
-        if row["uploads_used"] >= MAX_UPLOADS:
-            return False
-
-        supabase.table("usage_limits").update({
-            "uploads_used": row["uploads_used"] + 1
-        }).eq("user_id", user_id).execute()
-
-    return True
+    return check_and_increment(user_id, action)["allowed"]
 
 
 def get_user_limits(user_id):
-    ensure_user_row(user_id)
-
-    row = supabase.table("usage_limits") \
-        .select("*") \
-        .eq("user_id", user_id) \
-        .single() \
-        .execute() \
-        .data
+    with _limits_cache_lock:
+        cached = _limits_cache.get(user_id)
 
-    row = reset_if_new_day(row, user_id)
+    if cached and cached[0] > time.monotonic() and cached[1]["last_reset"] == date.today().isoformat():
+        row = cached[1]
+    else:
+        row = check_and_increment(user_id, "peek")
 
     return {
         "questions_used": row["questions_used"],
         "questions_limit": MAX_QUESTIONS
     }
-
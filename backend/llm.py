@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from langchain_core.runnables import Runnable
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-chat")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.deepseek.com/v1")
+# Upstream calls in flight per worker process; more wait in a queue
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+# Per attempt (connect/read); the deadline bounds the whole call including retries
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = 0.5
+LLM_RETRY_MAX_SECONDS = 8.0
+
+_gateway = None
+_gateway_pid = None
+_gateway_lock = threading.Lock()
+
+
+class LLMBusy(Exception):
+    """No upstream slot freed up within the queue timeout"""
+
+
+class LLMDeadlineExceeded(Exception):
+    """The call (including retries) ran past its deadline"""
+
+
+def is_transient(error) -> bool:
+    """Timeouts, connection failures, 429 and 5xx: worth another attempt"""
+    import httpx
+    import openai
+
+    return isinstance(error, (
+        TimeoutError,  # asyncio.wait_for on an attempt
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+        httpx.TimeoutException,
+        httpx.TransportError,
+    ))
+
+
+def build_chat_model():
+    """ChatOpenAI on pooled keep-alive httpx clients; retries are left to the gateway"""
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONCURRENCY * 2,
+        max_keepalive_connections=LLM_MAX_CONCURRENCY,
+        keepalive_expiry=60,
+    )
+    timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0)
+    return ChatOpenAI(
+        model=LLM_MODEL,
+        openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
+        base_url=LLM_BASE_URL,
+        default_headers={
+            "HTTP-Referer": "http://localhost:5000",
+            "X-Title": "Legal RAG Assistant",
+        },
+        request_timeout=LLM_TIMEOUT_SECONDS,
+        max_retries=0,
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+
+
+class LLMGateway(Runnable):
+    """
+    Wraps a chat model as a Runnable (drop-in for `prompt | model | parser`)
+    and adds, per process:
+    - a concurrency limit: at most `max_concurrency` upstream calls, others
+      queue for up to `queue_timeout` seconds and then get LLMBusy
+    - a deadline for the whole call, retries included; invoke/ainvoke
+      attempts are cut short at the deadline, streams are checked per chunk
+    - retries with full-jitter exponential backoff on transient errors;
+      a stream is only retried if it failed before its first chunk
+    Sync and async callers each get `max_concurrency` slots.
+    """
+
+    def __init__(self, model, max_concurrency=LLM_MAX_CONCURRENCY, queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+                 deadline_seconds=LLM_DEADLINE_SECONDS, max_retries=LLM_MAX_RETRIES):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphore = None
+        self._async_loop = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+
+    # Slots
+
+    def _enter_queue(self):
+        with self._lock:
+            self.waiting += 1
+        return time.perf_counter()
+
+    def _leave_queue(self, queued_at, acquired):
+        metrics.observe("llm_queue_wait", time.perf_counter() - queued_at)
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_flight += 1
+            else:
+                self.rejected += 1
+        if not acquired:
+            raise LLMBusy(f"No LLM slot within {self.queue_timeout:.0f}s ({self.max_concurrency} in flight)")
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @contextmanager
+    def _slot(self):
+        queued_at = self._enter_queue()
+        self._leave_queue(queued_at, self._semaphore.acquire(timeout=self.queue_timeout))
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+            self._release()
+
+    @asynccontextmanager
+    async def _async_slot(self):
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_loop = loop
+        semaphore = self._async_semaphore
+        queued_at = self._enter_queue()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+            acquired = True
+        except asyncio.TimeoutError:
+            acquired = False
+        self._leave_queue(queued_at, acquired)
+        try:
+            yield
+        finally:
+            semaphore.release()
+            self._release()
+
+    # Retry policy
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Seconds to wait before the next attempt; re-raises when not retrying."""
+        if attempt >= self.max_retries or not is_transient(error):
+            raise error
+        delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            with self._lock:
+                self.deadline_exceeded += 1
+            raise LLMDeadlineExceeded(f"LLM call exceeded {self.deadline_seconds:.0f}s") from error
+        with self._lock:
+            self.retries += 1
+        logger.warning(f"LLM call failed ({type(error).__name__}), retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    def _check_deadline(self, deadline):
+        if time.monotonic() >= deadline:
+            with self._lock:
+                self.deadline_exceeded += 1
+            raise LLMDeadlineExceeded(f"LLM call exceeded {self.deadline_seconds:.0f}s")
+
+    def _attempt_timeout(self, deadline):
+        """Seconds the next attempt may run: the per-attempt timeout, cut to what is left of the deadline"""
+        self._check_deadline(deadline)
+        return min(LLM_TIMEOUT_SECONDS, deadline - time.monotonic())
+
+    # Runnable interface
+
+    def invoke(self, input, config=None, **kwargs):
+        deadline = time.monotonic() + self.deadline_seconds
+        with self._slot():
+            attempt = 0
+            while True:
+                # ChatOpenAI passes `timeout` through as the request's own timeout
+                attempt_kwargs = dict(kwargs, timeout=self._attempt_timeout(deadline))
+                try:
+                    return self.model.invoke(input, config, **attempt_kwargs)
+                except Exception as e:
+                    time.sleep(self._retry_delay(e, attempt, deadline))
+                    attempt += 1
+
+    def stream(self, input, config=None, **kwargs):
+        deadline = time.monotonic() + self.deadline_seconds
+        with self._slot():
+            attempt = 0
+            while True:
+                started = False
+                try:
+                    for chunk in self.model.stream(input, config, **kwargs):
+                        started = True
+                        yield chunk
+                        self._check_deadline(deadline)
+                    return
+                except LLMDeadlineExceeded:
+                    raise
+                except Exception as e:
+                    if started:
+                        raise
+                    time.sleep(self._retry_delay(e, attempt, deadline))
+                    attempt += 1
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        deadline = time.monotonic() + self.deadline_seconds
+        async with self._async_slot():
+            attempt = 0
+            while True:
+                timeout = self._attempt_timeout(deadline)
+                try:
+                    return await asyncio.wait_for(self.model.ainvoke(input, config, **kwargs), timeout)
+                except Exception as e:
+                    await asyncio.sleep(self._retry_delay(e, attempt, deadline))
+                    attempt += 1
+
+    async def astream(self, input, config=None, **kwargs):
+        deadline = time.monotonic() + self.deadline_seconds
+        async with self._async_slot():
+            attempt = 0
+            while True:
+                started = False
+                try:
+                    async for chunk in self.model.astream(input, config, **kwargs):
+                        started = True
+                        yield chunk
+                        self._check_deadline(deadline)
+                    return
+                except LLMDeadlineExceeded:
+                    raise
+                except Exception as e:
+                    if started:
+                        raise
+                    await asyncio.sleep(self._retry_delay(e, attempt, deadline))
+                    attempt += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "retries": self.retries,
+                "deadline_exceeded": self.deadline_exceeded,
+            }
+
+
+def get_llm_gateway() -> LLMGateway:
+    """One gateway (and HTTP connection pool) per process, shared by every session"""
+    global _gateway, _gateway_pid
+    if _gateway is None or _gateway_pid != os.getpid():
+        with _gateway_lock:
+            if _gateway is None or _gateway_pid != os.getpid():
+                _gateway = LLMGateway(build_chat_model())
+                _gateway_pid = os.getpid()
+    return _gateway
+
+
+def loaded_llm_gateway():
+    """The gateway if this process has built it, else None"""
+    return _gateway if _gateway_pid == os.getpid() else None
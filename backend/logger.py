@@ -1,12 +1,154 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+
 from backend.supabase_client import supabase
 
+logger = logging.getLogger(__name__)
+
+QA_LOG_QUEUE_SIZE = int(os.getenv("QA_LOG_QUEUE_SIZE", "1000"))
+QA_LOG_BATCH_SIZE = int(os.getenv("QA_LOG_BATCH_SIZE", "50"))
+QA_LOG_FLUSH_SECONDS = float(os.getenv("QA_LOG_FLUSH_SECONDS", "2"))
+QA_LOG_MAX_RETRIES = int(os.getenv("QA_LOG_MAX_RETRIES", "5"))
+# Rows that can't be queued or written are appended here and replayed on next start
+QA_LOG_SPILL_PATH = os.getenv("QA_LOG_SPILL_PATH", os.path.join(tempfile.gettempdir(), "qa_logs_spill.jsonl"))
+
+_queue = queue.Queue(maxsize=QA_LOG_QUEUE_SIZE)
+_flusher = None
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+_stop = threading.Event()
+
+
 def log_qa(user_id, document_name, question, answer, sources=None):
-    supabase.table("qa_logs").insert({
+    """Queue a qa_logs row; written in batches by a background thread."""
+    row = {
         "user_id": user_id,
         "document_name": document_name,
         "question": question,
         "answer": answer,
         "sources": sources or []
-    }).execute()
-    print("QA logged for user:", user_id)
+    }
+    _ensure_flusher()
+    try:
+        _queue.put_nowait(row)
+    except queue.Full:
+        logger.warning("QA log queue full, spilling row to disk")
+        _spill([row])
+
+
+def queue_depth():
+    return _queue.qsize()
+
+
+def _ensure_flusher():
+    # Started lazily, and again in a forked worker (threads don't survive fork)
+    global _flusher, _flusher_pid
+    if _flusher is not None and _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher is None or _flusher_pid != os.getpid():
+            _flusher = threading.Thread(target=_flush_loop, name="qa-log-flusher", daemon=True)
+            _flusher_pid = os.getpid()
+            _flusher.start()
+
+
+def _insert(rows):
+    """Bulk insert with exponential backoff + jitter; spill if every attempt fails."""
+    for attempt in range(QA_LOG_MAX_RETRIES):
+        try:
+            supabase.table("qa_logs").insert(rows).execute()
+            return True
+        except Exception as e:
+            delay = min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"QA log insert failed ({str(e)}), retry {attempt + 1} in {delay:.1f}s")
+            if _stop.wait(delay):
+                break
+    _spill(rows)
+    return False
+
+
+def _spill(rows):
+    try:
+        # One os.write per row on an O_APPEND descriptor, so rows from
+        # concurrent workers never interleave (a buffered file would split
+        # long rows into several writes)
+        fd = os.open(QA_LOG_SPILL_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            for row in rows:
+                os.write(fd, (json.dumps(row) + "\n").encode())
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.error(f"Could not spill {len(rows)} QA log rows: {str(e)}")
+
+
+def _replay_spill():
+    """Take ownership of spilled rows (atomic rename) and insert them."""
+    claimed = f"{QA_LOG_SPILL_PATH}.{os.getpid()}.replay"
+    try:
+        os.rename(QA_LOG_SPILL_PATH, claimed)
+    except FileNotFoundError:
+        return
+
+    rows = []
+    with open(claimed) as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue  # partial line from a crash mid-write
+    os.remove(claimed)
+    # Failed batches go back to the spill file through _insert
+    for start in range(0, len(rows), QA_LOG_BATCH_SIZE):
+        _insert(rows[start:start + QA_LOG_BATCH_SIZE])
+    logger.info(f"Replayed {len(rows)} spilled QA log rows")
+
+
+def _drain(limit):
+    rows = []
+    while len(rows) < limit:
+        try:
+            rows.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return rows
+
+
+def _flush_loop():
+    _replay_spill()
+    while not _stop.is_set():
+        # Block for the first row, then gather a batch until size or time limit
+        try:
+            rows = [_queue.get(timeout=1.0)]
+        except queue.Empty:
+            continue
+        deadline = time.monotonic() + QA_LOG_FLUSH_SECONDS
+        while len(rows) < QA_LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _insert(rows)
+
 
+@atexit.register
+def _shutdown():
+    """Best effort on worker exit: one write attempt, spill the rest."""
+    _stop.set()
+    rows = _drain(QA_LOG_QUEUE_SIZE)
+    if not rows:
+        return
+    try:
+        supabase.table("qa_logs").insert(rows).execute()
+    except Exception:
+        _spill(rows)
\ No newline at end of file
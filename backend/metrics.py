@@ -0,0 +1,92 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Fraction of requests whose stage timings are recorded (decided once per request)
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))
+
+# Seconds; spans from sub-millisecond cache hits up to full LLM answers
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_sampled = contextvars.ContextVar("metrics_sampled", default=True)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram per stage label, Prometheus style."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # stage -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            series = self._series.get(stage)
+            if series is None:
+                series = self._series[stage] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {stage: list(values) for stage, values in self._series.items()}
+        for stage in sorted(series):
+            values = series[stage]
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{stage="{stage}",le="+Inf"}} {values[-1]}')
+            lines.append(f'{self.name}_sum{{stage="{stage}"}} {values[-2]:.6f}')
+            lines.append(f'{self.name}_count{{stage="{stage}"}} {values[-1]}')
+        return lines
+
+
+stage_latency = Histogram("rag_stage_duration_seconds", "Time spent per request pipeline stage")
+
+
+def start_trace(sample_rate=None):
+    """Decide once per request whether its spans are recorded."""
+    rate = METRICS_SAMPLE_RATE if sample_rate is None else sample_rate
+    _sampled.set(rate >= 1.0 or random.random() < rate)
+
+
+def observe(stage, seconds):
+    if _sampled.get():
+        stage_latency.observe(stage, seconds)
+
+
+def observe_ms(timings: dict):
+    """Record a {stage: milliseconds} dict, e.g. HybridRetriever.retrieve()["timings"]"""
+    for stage, ms in timings.items():
+        observe(stage, ms / 1000)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def render(gauges=None) -> str:
+    """
+    Prometheus text exposition. `gauges` is {metric_name: value}. Values are
+    per process: each gunicorn worker reports its own.
+    """
+    lines = stage_latency.render()
+    for name, value in sorted((gauges or {}).items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,213 @@
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader, PdfWriter
+
+logger = logging.getLogger(__name__)
+
+# Partitioning runs inside each of the INGEST_WORKERS ingest processes
+# (backend/jobs.py), and each keeps its own partition pool, so by default
+# the cores are split between them: at most ~cpu_count partition processes
+# (each loading the layout model) per gunicorn worker, not INGEST_WORKERS x that
+_INGEST_PROCESSES = max(1, int(os.getenv("INGEST_WORKERS", "2")))
+PARTITION_WORKERS = int(os.getenv("PARTITION_WORKERS", str(max(1, (os.cpu_count() or 1) // _INGEST_PROCESSES))))
+PARTITION_PAGES_PER_RANGE = int(os.getenv("PARTITION_PAGES_PER_RANGE", "4"))
+
+# Adaptive strategy: text-layer pages use "fast", the rest keep the configured strategy
+PARTITION_ADAPTIVE = os.getenv("PARTITION_ADAPTIVE", "1") == "1"
+MIN_TEXT_CHARS = int(os.getenv("PARTITION_MIN_TEXT_CHARS", "200"))
+TABLE_LINE_RATIO = float(os.getenv("PARTITION_TABLE_LINE_RATIO", "0.3"))
+
+NLTK_DATA_PATH = os.getenv("NLTK_DATA_PATH", "/opt/render/nltk_data")
+NLTK_PACKAGES = [
+    "punkt",
+    "punkt_tab",
+    "averaged_perceptron_tagger",
+    "averaged_perceptron_tagger_eng"
+]
+
+NUMERIC_TOKEN = re.compile(r"^[(\-$€£₹]*[\d.,/%]+\)?$")
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_nltk_ready = False
+
+
+def ensure_nltk_data():
+    """
+    Make the NLTK resources unstructured needs available, downloading any
+    that are missing. Once per process, before the first partition (pool
+    workers are spawned, so each needs the data path too).
+    """
+    global _nltk_ready
+    if _nltk_ready:
+        return
+    import nltk
+
+    os.makedirs(NLTK_DATA_PATH, exist_ok=True)
+    if NLTK_DATA_PATH not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_PATH)
+    for pkg in NLTK_PACKAGES:
+        try:
+            nltk.data.find(pkg)
+        except LookupError:
+            nltk.download(pkg, download_dir=NLTK_DATA_PATH)
+    _nltk_ready = True
+
+
+def _partition_pdf(filename, **params):
+    ensure_nltk_data()
+    from unstructured.partition.pdf import partition_pdf
+
+    return partition_pdf(filename=filename, **params)
+
+
+def adaptive_params() -> dict:
+    """Settings that change partition output; part of the ingest cache key"""
+    if not PARTITION_ADAPTIVE:
+        return {"adaptive": False}
+    return {"adaptive": True, "min_text_chars": MIN_TEXT_CHARS, "table_line_ratio": TABLE_LINE_RATIO}
+
+
+def is_table_line(line: str) -> bool:
+    """Three or more tokens, mostly numbers/amounts: a row of a figures table"""
+    tokens = line.split()
+    if len(tokens) < 3:
+        return False
+    return sum(1 for token in tokens if NUMERIC_TOKEN.match(token)) / len(tokens) >= 0.5
+
+
+def page_strategy(page, default: str) -> str:
+    """
+    "fast" when the page has a usable text layer, else `default` (hi_res).
+    Scanned pages have (almost) no extractable text; table-heavy pages have
+    many figure rows and need layout inference to keep their structure.
+    """
+    try:
+        text = page.extract_text()
+    except Exception:
+        return default
+
+    if len((text or "").strip()) < MIN_TEXT_CHARS:
+        return default
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    table_lines = sum(1 for line in lines if is_table_line(line))
+    if lines and table_lines / len(lines) > TABLE_LINE_RATIO:
+        return default
+    return "fast"
+
+
+def plan_page_strategies(reader: PdfReader, default: str):
+    """Strategy per page, index 0 = page 1"""
+    if not PARTITION_ADAPTIVE or default == "fast":
+        return [default] * len(reader.pages)
+    return [page_strategy(page, default) for page in reader.pages]
+
+
+def page_ranges(strategies, workers: int, pages_per_range: int = PARTITION_PAGES_PER_RANGE):
+    """
+    1-based inclusive (start, end, strategy) ranges of consecutive pages that
+    share a strategy. Ranges are small enough that every worker gets several,
+    so one slow (table-heavy) range doesn't stall the rest.
+    """
+    n_pages = len(strategies)
+    size = max(1, min(pages_per_range, -(-n_pages // max(workers, 1))))
+    ranges = []
+    start = 1
+    for page in range(2, n_pages + 2):
+        if page == n_pages + 1 or page - start == size or strategies[page - 1] != strategies[start - 1]:
+            ranges.append((start, page - 1, strategies[start - 1]))
+            start = page
+    return ranges
+
+
+def partition_page_range(pdf_file_path: str, start: int, end: int, params: dict):
+    """Partition pages start..end of the PDF, with page numbers relative to the whole file."""
+    reader = PdfReader(pdf_file_path)
+    writer = PdfWriter()
+    for page in reader.pages[start - 1:end]:
+        writer.add_page(page)
+
+    fd, range_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            writer.write(f)
+        elements = _partition_pdf(range_path, **params)
+    finally:
+        os.remove(range_path)
+
+    filename = os.path.basename(pdf_file_path)
+    directory = os.path.dirname(pdf_file_path)
+    for element in elements:
+        if element.metadata.page_number is not None:
+            element.metadata.page_number += start - 1
+        element.metadata.filename = filename
+        element.metadata.file_directory = directory
+    return elements
+
+
+def _get_pool(workers: int):
+    # Kept alive between ingests so each worker loads the layout model once.
+    # spawn: the parent may already hold torch/onnxruntime threads.
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _range_params(params: dict, strategy: str) -> dict:
+    range_params = dict(params, strategy=strategy)
+    if strategy != "hi_res":
+        range_params.pop("model_name", None)
+    return range_params
+
+
+def partition_pdf_parallel(pdf_file_path: str, params: dict, workers: int = PARTITION_WORKERS):
+    """
+    partition_pdf split across page ranges in a process pool, with a
+    per-page strategy (see page_strategy). Elements come back in page order
+    with page_number/filename metadata as if the whole file had been
+    partitioned at once, so chunk_by_title sees the same kind of input.
+
+    Returns (elements, {page_number: strategy}).
+    """
+    reader = PdfReader(pdf_file_path)
+    strategies = plan_page_strategies(reader, params.get("strategy", "hi_res"))
+    page_strategies = {page: strategy for page, strategy in enumerate(strategies, start=1)}
+    ranges = page_ranges(strategies, workers)
+
+    n_slow = sum(1 for strategy in strategies if strategy != "fast")
+    logger.info(
+        f"Partitioning {len(strategies)} pages ({n_slow} {params.get('strategy')}, "
+        f"{len(strategies) - n_slow} fast) as {len(ranges)} ranges on {workers} workers"
+    )
+
+    if len(set(strategies)) <= 1 and (workers <= 1 or len(ranges) <= 1):
+        strategy = strategies[0] if strategies else params.get("strategy")
+        return _partition_pdf(pdf_file_path, **_range_params(params, strategy)), page_strategies
+
+    if workers <= 1:
+        results = [
+            partition_page_range(pdf_file_path, start, end, _range_params(params, strategy))
+            for start, end, strategy in ranges
+        ]
+        return [element for elements in results for element in elements], page_strategies
+
+    pool = _get_pool(workers)
+    futures = [
+        pool.submit(partition_page_range, pdf_file_path, start, end, _range_params(params, strategy))
+        for start, end, strategy in ranges
+    ]
+    # Collect in submission order, which is page order
+    return [element for future in futures for element in future.result()], page_strategies
@@ -1,13 +1,18 @@
+import asyncio
 import logging
-import streamlit as st
 import tempfile
 import os
+import threading
+import time
+import uuid
+from typing import Any, List
 
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import numpy as np
 
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
+# ChatOpenAI, unstructured and langchain_community are imported where they
+# are used: importing this module (and so app.py) stays cheap, and the
+# heavy modules load once per process on first ingest/question, or in the
+# gunicorn master when warm-up is enabled (backend/warmup.py).
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
@@ -15,40 +20,363 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document
 
 #from langchain.retrievers import ContextualCompressionRetriever
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+from langchain_core.retrievers import BaseRetriever
 
 #from langchain_community.document_compressors import LLMChainExtractor
 
-from langchain_community.vectorstores.utils import filter_complex_metadata
-
-from unstructured.partition.pdf import partition_pdf
-from unstructured.chunking.title import chunk_by_title
-
 from dotenv import load_dotenv
 
+from backend.bm25 import BM25Index
+from backend.corpus import CorpusIndex
+from backend.structure import chunk_structure, parse_structure_query, STRUCTURE_FORMAT_VERSION
+from backend.partition import partition_pdf_parallel, adaptive_params
+from backend.ingest_cache import ingest_cache, file_sha256
+from backend.embeddings import get_embedding_service, EMBEDDING_DIM
+from backend.vector_index import VectorIndex, VECTOR_INDEX_DTYPE, INDEX_FORMAT_VERSION
+from backend.answer_cache import answer_cache
+from backend.context import context_packer
+from backend.router import query_router
+from backend.rerank import get_reranker, rerank_enabled
+from backend import metrics
+from backend.llm import get_llm_gateway
+
 load_dotenv() 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PARTITION_PARAMS = {"strategy": "hi_res", "model_name": "yolox"}
+CHUNKING_PARAMS = {
+    "max_characters": 1500,
+    "overlap": 400,
+    "combine_text_under_n_chars": 75,
+    "new_after_n_chars": 1200,
+}
+EMBED_PROGRESS_BATCH = 256
+# Most fusion weight moved per query between dense (similarity + MMR) and BM25,
+# toward the retriever whose top hit stands out more (see adaptive_weights)
+FUSION_ADAPTIVE_SHIFT = float(os.getenv("FUSION_ADAPTIVE_SHIFT", "0.2"))
+# Log the first 200 characters of every retrieved chunk (debugging retrieval only)
+LOG_RETRIEVED_CHUNKS = os.getenv("LOG_RETRIEVED_CHUNKS", "0") == "1"
+
+
+def partition_and_chunk(pdf_file_path: str) -> List[Document]:
+    from langchain_community.vectorstores.utils import filter_complex_metadata
+    from unstructured.chunking.title import chunk_by_title
+
+    logger.info(f"Loading and partitioning PDF: {pdf_file_path}")
+    # Split across page ranges on PARTITION_WORKERS processes; text-layer
+    # pages use the fast strategy, scanned/table pages keep hi_res
+    elements, page_strategies = partition_pdf_parallel(
+        pdf_file_path,
+        PARTITION_PARAMS
+        # infer_table_structure=True,
+        # extract_images_in_pdf=True
+    )
+    logger.info(f"Partitioned into {len(elements)} elements")
+
+    # Perform smart chunking
+    chunks = chunk_by_title(elements=elements, **CHUNKING_PARAMS)
+    logger.info(f"Chunked into {len(chunks)} semantic chunks")
+
+    # Convert ElementMetadata to dictionary for compatibility
+    processed_chunks = []
+    section = None
+    for chunk in chunks:
+        metadata = {}
+        if hasattr(chunk, 'metadata') and chunk.metadata:
+            # Convert ElementMetadata to dict
+            metadata_dict = chunk.metadata.to_dict() if hasattr(chunk.metadata, 'to_dict') else {}
+            # Filter to simple types (strings, numbers, etc.); orig_elements is
+            # a compressed copy of the chunk, summarized by chunk_structure below
+            for key, value in metadata_dict.items():
+                if key == "orig_elements":
+                    continue
+                if isinstance(value, (str, int, float, bool, type(None))):
+                    metadata[key] = value
+                else:
+                    metadata[key] = str(value)  # Convert complex types to string
+            # Page range, section heading and element types, for StructureIndex
+            structure = chunk_structure(chunk, section)
+            section = structure["section"]
+            metadata.update(structure)
+        # Which partition strategy produced the chunk's (first) page
+        metadata["partition_strategy"] = page_strategies.get(
+            metadata.get("page_number"), PARTITION_PARAMS["strategy"]
+        )
+        processed_chunks.append(Document(page_content=chunk.text, metadata=metadata))
+
+    # Apply filter_complex_metadata
+    return filter_complex_metadata(processed_chunks)
+
+
+def prepare_document(pdf_file_path: str, content_hash: str = None, progress=None, embeddings=None):
+    """
+    CPU-heavy half of ingest: partition, chunk and embed (or load all of that
+    from the ingest cache). Returns the document's memory-mapped VectorIndex.
+    Safe to run in a worker process; `progress(stage, percent)` is called
+    between stages and may raise to cancel.
+    """
+    report = progress or (lambda stage, percent: None)
+    embeddings = embeddings or get_embedding_service()
+
+    report("hashing", 2)
+    # Same file + same parameters -> reuse chunks and vectors from disk
+    cache_key = ingest_cache.make_key(
+        content_hash or file_sha256(pdf_file_path),
+        {
+            "partition": dict(PARTITION_PARAMS, **adaptive_params()),
+            "chunking": CHUNKING_PARAMS,
+            "structure": STRUCTURE_FORMAT_VERSION,
+            "embedding_model": embeddings.cache_tag,
+            "index": {"format": INDEX_FORMAT_VERSION, "dtype": VECTOR_INDEX_DTYPE},
+        },
+    )
+    cached = ingest_cache.get(cache_key)
+    if cached:
+        logger.info(f"Ingest cache hit: {len(cached)} chunks, stats={ingest_cache.stats()}")
+        return cached
+
+    report("partitioning", 5)
+    processed_chunks = partition_and_chunk(pdf_file_path)
+
+    texts = [doc.page_content for doc in processed_chunks]
+    vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    for start in range(0, len(texts), EMBED_PROGRESS_BATCH):
+        report("embedding", 50 + int(45 * start / max(len(texts), 1)))
+        batch = texts[start:start + EMBED_PROGRESS_BATCH]
+        vectors[start:start + len(batch)] = embeddings.encode(batch)
+
+    index = ingest_cache.put(cache_key, processed_chunks, vectors)
+    logger.info(f"Ingest cache miss, stored {cache_key}, stats={ingest_cache.stats()}")
+    return index
+
+
+def source_refs(documents, scores):
+    """Compact, JSON-serializable pointers to the retrieved chunks, for qa_logs.sources"""
+    return [
+        {
+            "file_id": doc.metadata.get("file_id"),
+            "source": doc.metadata.get("source"),
+            "filename": doc.metadata.get("filename"),
+            "page_number": doc.metadata.get("page_number"),
+            "page_end": doc.metadata.get("page_end"),
+            "section": doc.metadata.get("section"),
+            "element_id": doc.metadata.get("element_id"),
+            "score": round(float(score), 4),
+        }
+        for doc, score in zip(documents, scores)
+    ]
+
+
+def mmr_select(query_embedding, candidates, k: int, lambda_mult: float = 0.5):
+    """
+    Maximal marginal relevance over a candidate matrix (rows = embeddings).
+    Same selection rule as langchain's maximal_marginal_relevance, but keeps a
+    running max-similarity vector so each step is one matvec.
+    Returns positions into `candidates`, in selection order.
+    """
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    norms = np.linalg.norm(candidates, axis=1)
+    norms[norms == 0] = 1.0
+    unit = candidates / norms[:, None]
+    query = np.asarray(query_embedding, dtype=unit.dtype)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    query_sim = unit @ query
+    selected = [int(np.argmax(query_sim))]
+    redundancy = unit @ unit[selected[0]]
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        score = lambda_mult * query_sim - (1 - lambda_mult) * redundancy
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, unit @ unit[best])
+
+    return selected
+
+
+def score_peak(scores) -> float:
+    """How far the top score stands out from the list it heads (z-score); 0 for an empty or flat list"""
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) < 2 or scores[0] <= 0:
+        return 0.0
+    spread = scores.std()
+    return float((scores[0] - scores.mean()) / spread) if spread > 0 else 0.0
+
+
+def adaptive_weights(weights, dense_scores, keyword_scores, max_shift: float):
+    """
+    Per-query fusion weights from the two retrievers' score distributions:
+    up to `max_shift` moves from the dense lists (similarity + MMR, kept in
+    proportion) to BM25 when BM25's top hit stands out more than the dense
+    one, and back the other way when it stands out less. An identifier or
+    amount that a few chunks contain gives a sharp BM25 peak over a flat
+    dense list; a paraphrase gives the opposite.
+    """
+    if max_shift <= 0 or len(weights) != 3:
+        return list(weights)
+    similarity, mmr, keyword = weights
+    shift = max_shift * float(np.tanh((score_peak(keyword_scores) - score_peak(dense_scores)) / 2))
+    shifted = min(max(keyword + shift, 0.0), similarity + mmr + keyword)
+    scale = (similarity + mmr - (shifted - keyword)) / (similarity + mmr) if similarity + mmr else 0.0
+    return [similarity * scale, mmr * scale, shifted]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Single-pass hybrid retrieval: embed the query once, fetch dense top-N once,
+    MMR-rerank that same candidate set, add BM25, and fuse with weighted
+    reciprocal rank fusion (same formula as EnsembleRetriever).
+    `file_ids` restricts both the dense and keyword search to those files;
+    `structure_positions` (chunks on the page/section the question names,
+    CorpusIndex.select) adds one more ranked list: those chunks by dense
+    similarity, fused with `structure_weight`. It boosts them without
+    hiding the rest of the corpus from the other lists.
+    With `min_score_ratio` > 0 the fused list is cut where scores fall below
+    that fraction of the best score (k is then a ceiling, not a target).
+    With `adaptive_shift` > 0 `weights` are the base for adaptive_weights.
+    """
+    vector_index: Any
+    embeddings: Any
+    documents: Any  # chunk list; Any so pydantic does not copy it per query
+    keyword_index: Any = None
+    k: int = 18
+    weights: List[float] = [0.5, 0.3, 0.2]  # similarity, MMR, BM25
+    lambda_mult: float = 0.5
+    fetch_multiplier: int = 3
+    c: int = 60
+    file_ids: Any = None
+    structure_positions: Any = None
+    structure_weight: float = 0.5
+    min_score_ratio: float = 0.0
+    adaptive_shift: float = 0.0
+
+    def _stage_sizes(self):
+        similarity_k = self.k
+        mmr_k = max(int(self.k * 0.8), 5)  # Slightly less for MMR
+        keyword_k = max(int(self.k * 0.8), 5)  # Match MMR
+        fetch_k = self.k * self.fetch_multiplier  # Keep fetch_k ratio
+        return similarity_k, mmr_k, keyword_k, fetch_k
+
+    def _dense_candidates(self, query_embedding, fetch_k: int):
+        """One index scan returning chunk positions, their scores and their embeddings"""
+        if self.file_ids is None:
+            positions, scores = self.vector_index.search(query_embedding, fetch_k)
+        else:
+            positions, scores = self.vector_index.search(query_embedding, fetch_k, file_ids=self.file_ids)
+        return positions, scores, self.vector_index.vectors(positions)
+
+    def retrieve(self, query: str, query_embedding=None) -> dict:
+        """
+        Returns {"documents": [...], "scores": [...], "weights": [...],
+        "timings": {stage: ms}} with documents ordered by fused score. Pass `query_embedding` if the
+        caller already has it.
+        """
+        timings = {}
+        similarity_k, mmr_k, keyword_k, fetch_k = self._stage_sizes()
+
+        if query_embedding is None:
+            start = time.perf_counter()
+            query_embedding = self.embeddings.embed_query_vector(query)
+            timings["embed"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        positions, dense_scores, matrix = self._dense_candidates(query_embedding, fetch_k)
+        timings["dense"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        mmr_positions = positions[mmr_select(query_embedding, matrix, mmr_k, self.lambda_mult)]
+        timings["mmr"] = (time.perf_counter() - start) * 1000
+
+        ranked_lists = [positions[:similarity_k], mmr_positions]
+        weights = list(self.weights)
+        if self.keyword_index is not None and len(self.keyword_index):
+            start = time.perf_counter()
+            keyword_positions, keyword_scores = self.keyword_index.top_k(query, keyword_k, keys=self.file_ids)
+            timings["bm25"] = (time.perf_counter() - start) * 1000
+            ranked_lists.append(keyword_positions)
+            # Both peaks over lists of the same length
+            weights = adaptive_weights(
+                weights, dense_scores[:keyword_k], keyword_scores, self.adaptive_shift
+            )
+        else:
+            weights = [0.6, 0.4]
+
+        if self.structure_positions is not None:
+            start = time.perf_counter()
+            # Scores only the named page/section's chunks, not the corpus
+            structure_ranked, _ = self.vector_index.search(
+                query_embedding, similarity_k, positions=self.structure_positions
+            )
+            timings["structure"] = (time.perf_counter() - start) * 1000
+            ranked_lists.append(structure_ranked)
+            weights.append(self.structure_weight)
+
+        # Weighted RRF: score += weight / (rank + c), rank starting at 1
+        start = time.perf_counter()
+        fused = np.zeros(len(self.documents))
+        for ranked, weight in zip(ranked_lists, weights):
+            fused[ranked] += weight / (np.arange(1, len(ranked) + 1) + self.c)
+        hits = np.flatnonzero(fused)
+        order = hits[np.argsort(-fused[hits], kind="stable")]
+        if self.min_score_ratio > 0 and len(order):
+            order = order[fused[order] >= self.min_score_ratio * fused[order[0]]]
+        timings["fusion"] = (time.perf_counter() - start) * 1000
+
+        return {
+            "documents": [self.documents[i] for i in order],
+            "scores": fused[order].tolist(),
+            "weights": weights[:3],
+            "timings": timings,
+        }
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        return self.retrieve(query)["documents"]
+
+
+class IndexSnapshot:
+    """
+    Everything a question reads from a ChatPDF, published as one object and
+    never modified afterwards. Writers build a new snapshot and swap it in
+    with a single attribute store; readers take one reference at the start
+    of a question and use only that, so they need no lock and never see a
+    half-applied add or remove.
+    """
+    __slots__ = ("vector_index", "keyword_index", "documents", "document_key")
+
+    def __init__(self, vector_index=None, keyword_index=None, document_key=None):
+        self.vector_index = vector_index
+        self.keyword_index = keyword_index
+        self.documents = vector_index.documents if vector_index is not None else []
+        self.document_key = document_key
+
+
+EMPTY_SNAPSHOT = IndexSnapshot()
+
 
 class ChatPDF:
-    vector_store = None
-    retriever = None
-    chain = None
+    embeddings = None
+    _snapshot = EMPTY_SNAPSHOT
     
-    def __init__(self):
-        # self.model = ChatOllama(model="llama3.1:8b")
-        self.model = ChatOpenAI(
-            model="deepseek-chat", #"meta-llama/llama-4-maverick",  # OpenRouter model name
-            openai_api_key=os.getenv("DEEPSEEK_API_KEY"),  # Your API key
-            base_url="https://api.deepseek.com/v1",  # OpenRouter endpoint
-            default_headers={
-                "HTTP-Referer": "http://localhost:5000",  # Optional: Your site URL
-                "X-Title": "Legal RAG Assistant",  # Optional: Your app name
-            }
-        )
+    def __init__(self, model=None):
+        """
+        `model`: any langchain chat model/runnable. Defaults to the process-wide
+        LLM gateway (DeepSeek via ChatOpenAI on a pooled client, see backend/llm.py).
+        """
+        # from langchain_ollama import ChatOllama
+        # model = ChatOllama(model="llama3.1:8b")
+        self.model = model or get_llm_gateway()
+        # Serializes writers (load/add/remove/clear); readers never take it
+        self._write_lock = threading.Lock()
         self.prompt = PromptTemplate.from_template(
             """
             You are a legal research assistant. Follow this plan:
@@ -75,6 +403,7 @@ class ChatPDF:
             Always:
             - Use bullet points and short sections.
             - Never invent text not in context; if missing, state “Missing from provided context.”
+            - Each context excerpt starts with its page, e.g. [p. 12] or [lease.pdf, pp. 12-13], then its section heading if known; use these for pin-cites.
 
             Question: {question}
 
@@ -87,215 +416,317 @@ class ChatPDF:
         )
         logger.info("ChatPDF initialized")
 
-    def classify_query(self, query: str) -> dict:
+    def classify_query(self, query: str, query_embedding=None) -> dict:
         """
-        Classify legal query and determine optimal retrieval parameters
-        Returns: {"type": str, "k_value": int, "description": str}
+        Classify legal query and determine optimal retrieval parameters, by
+        nearest exemplar centroid on the query embedding (backend/router.py)
+        Returns: {"type": str, "k_value": int, "description": str,
+        "min_score_ratio": float, "rerank_keep": int, "confidence": float, "margin": float, "method": str}
         """
-        query_lower = query.lower()
-        
-        # Factual extraction patterns - need fewer chunks
-        factual_patterns = [
-            "what was", "when did", "amount", "date", "number", "premium", 
-            "policy number", "sum assured", "issue date", "lapse date",
-            "payment history", "specific", "exactly"
-        ]
-        
-        # Legal analysis patterns - need more chunks for comprehensive analysis  
-        analysis_patterns = [
-            "grounds for", "legal basis", "precedent", "arguments", "why",
-            "dismiss", "reject", "defense", "liability", "breach",
-            "key legal", "main reasons", "basis for"
-        ]
-        
-        # Process/mechanism patterns - medium chunk count
-        process_patterns = [
-            "circumstances", "under what", "how can", "when can", "process",
-            "procedure", "steps", "mechanism", "conditions", "requirements"
-        ]
-        
-        # Check patterns in order of specificity
-        if any(pattern in query_lower for pattern in factual_patterns):
-            return {
-                "type": "factual",
-                "k_value": 8,
-                "description": "Factual extraction - focused retrieval"
-            }
-        elif any(pattern in query_lower for pattern in analysis_patterns):
-            return {
-                "type": "analysis", 
-                "k_value": 22,
-                "description": "Legal analysis - comprehensive retrieval"
-            }
-        elif any(pattern in query_lower for pattern in process_patterns):
-            return {
-                "type": "process",
-                "k_value": 15,
-                "description": "Process/mechanism - moderate retrieval"
-            }
-        else:
-            return {
-                "type": "general",
-                "k_value": 18,
-                "description": "General query - balanced retrieval"
-            }
-
-    def create_dynamic_retriever(self, k_value: int):
-        """Create retriever with dynamic k values based on query type"""
-        
-        # Adjust k values proportionally
-        similarity_k = k_value
-        mmr_k = max(int(k_value * 0.8), 5)  # Slightly less for MMR
-        keyword_k = max(int(k_value * 0.8), 5)  # Match MMR
-        mmr_fetch_k = k_value * 3  # Keep fetch_k ratio
-        
-        logger.info(f"Creating dynamic retriever with similarity_k={similarity_k}, mmr_k={mmr_k}, keyword_k={keyword_k}")
-        
-        # Enhanced temporal-aware retriever setup with dynamic k
-        similarity_retriever = self.vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": similarity_k}
-        )
+        if self.embeddings is None:
+            self.embeddings = get_embedding_service()
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query_vector(query)
+        return query_router.route(query, query_embedding, self.embeddings)
+
+    @property
+    def vector_index(self):
+        return self._snapshot.vector_index
+
+    @property
+    def keyword_index(self):
+        return self._snapshot.keyword_index
+
+    @property
+    def document_key(self):
+        return self._snapshot.document_key
+
+    @property
+    def retriever(self):
+        return self.create_dynamic_retriever(k_value=18) if self._snapshot.documents else None
+
+    @property
+    def chain(self):
+        """Fixed-k chain over the current snapshot (ask() builds its own per query)"""
+        retriever = self.retriever
+        if retriever is None:
+            return None
 
-        # MMR for diversity
-        mmr_retriever = self.vector_store.as_retriever(
-            search_type="mmr",
-            search_kwargs={
-                "k": mmr_k,
-                "fetch_k": mmr_fetch_k,
-                "lambda_mult": 0.5
-            }
+        def format_docs(docs):
+            return "\n\n".join(doc.page_content for doc in docs)
+        return (
+            {"context": retriever | format_docs, "question": RunnablePassthrough()}
+            | self.prompt
+            | self.model
+            | StrOutputParser()
         )
 
-        # Create new keyword retriever with dynamic k
-        # (We need to recreate this since BM25Retriever k is set at initialization)
-        processed_chunks = []
-        if hasattr(self, '_processed_chunks'):
-            processed_chunks = self._processed_chunks
-        else:
-            # Fallback - recreate from vector store (less efficient but works)
-            logger.warning("Processed chunks not cached, may affect performance")
-            
-        keyword_retriever = BM25Retriever.from_documents(processed_chunks) if processed_chunks else None
-        if keyword_retriever:
-            keyword_retriever.k = keyword_k
-
-        # Create ensemble with available retrievers
-        retrievers = [similarity_retriever, mmr_retriever]
-        weights = [0.6, 0.4]
-        
-        if keyword_retriever:
-            retrievers.append(keyword_retriever)
-            weights = [0.5, 0.3, 0.2]
-        
-        return EnsembleRetriever(
-            retrievers=retrievers,
-            weights=weights
+    def create_dynamic_retriever(self, k_value: int, file_ids=None, weights=None, min_score_ratio=0.0,
+                                 snapshot: IndexSnapshot = None, structure_positions=None):
+        """
+        Create retriever with dynamic k values based on query type; fusion
+        weights start from `weights` (default 0.5/0.3/0.2) and adapt per query
+        by up to FUSION_ADAPTIVE_SHIFT
+        """
+        snapshot = snapshot or self._snapshot
+        if snapshot.keyword_index is None or not len(snapshot.keyword_index):
+            logger.warning("Keyword index not built, falling back to dense retrieval only")
+
+        logger.info(f"Creating hybrid retriever with k={k_value}")
+        return HybridRetriever(
+            vector_index=snapshot.vector_index,
+            embeddings=self.embeddings,
+            documents=snapshot.documents,
+            keyword_index=snapshot.keyword_index,
+            k=k_value,
+            file_ids=file_ids,
+            structure_positions=structure_positions,
+            weights=weights or [0.5, 0.3, 0.2],
+            min_score_ratio=min_score_ratio,
+            adaptive_shift=FUSION_ADAPTIVE_SHIFT,
         )
 
-    def ingest(self, pdf_file_path: str):
-        try:
-            logger.info(f"Loading and partitioning PDF: {pdf_file_path}")
-            elements = partition_pdf(
-                filename=pdf_file_path,
-                strategy="hi_res",
-                model_name="yolox"
-                # infer_table_structure=True,
-                # extract_images_in_pdf=True
-            )
-            logger.info(f"Partitioned into {len(elements)} elements")
-
-            # Perform smart chunking
-            chunks = chunk_by_title(
-                elements=elements,
-                max_characters=1500,
-                overlap = 400,
-                combine_text_under_n_chars=75,
-                new_after_n_chars=1200
-            )
-            logger.info(f"Chunked into {len(chunks)} semantic chunks")
-
-            # Convert ElementMetadata to dictionary for compatibility
-            processed_chunks = []
-            for chunk in chunks:
-                metadata = {}
-                if hasattr(chunk, 'metadata') and chunk.metadata:
-                    # Convert ElementMetadata to dict
-                    metadata_dict = chunk.metadata.to_dict() if hasattr(chunk.metadata, 'to_dict') else {}
-                    # Filter to simple types (strings, numbers, etc.)
-                    for key, value in metadata_dict.items():
-                        if isinstance(value, (str, int, float, bool, type(None))):
-                            metadata[key] = value
-                        else:
-                            metadata[key] = str(value)  # Convert complex types to string
-                processed_chunks.append(Document(page_content=chunk.text, metadata=metadata))
-            
-            # Apply filter_complex_metadata
-            processed_chunks = filter_complex_metadata(processed_chunks)
-
-            # Cache processed chunks for dynamic retriever creation
-            self._processed_chunks = processed_chunks
-
-            # Create vector store
-            embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
-            self.vector_store = Chroma.from_documents(documents=processed_chunks, embedding=embeddings)
-            logger.info("Vector store created")
-
-            # Create initial retriever (will be replaced dynamically per query)
-            self.retriever = self.create_dynamic_retriever(k_value=18)  # Default value
+    def load(self, vector_index: VectorIndex, document_name: str = None, file_id: str = None):
+        """Replace whatever this instance held with one prepared (memory-mapped) index"""
+        return self.add_document(vector_index, document_name, file_id, replace=True)
 
-            logger.info("Dynamic retriever system initialized")
-
-            def format_docs(docs):
-                return "\n\n".join(doc.page_content for doc in docs)
-            self.chain = (
-                {"context": self.retriever | format_docs, "question": RunnablePassthrough()}
-                | self.prompt
-                | self.model
-                | StrOutputParser()
-            )
-            logger.info("Chain created successfully")
+    def add_document(self, vector_index: VectorIndex, document_name: str = None, file_id: str = None,
+                     replace: bool = False):
+        """
+        Add a prepared document to the indexes already loaded. Only the new
+        chunks are tokenized; the other documents' vectors stay where they are.
+        Returns the file_id that filters or removes it later.
+        """
+        try:
+            if self.embeddings is None:
+                self.embeddings = get_embedding_service()
+
+            file_id = file_id or uuid.uuid4().hex
+            with self._write_lock:
+                current = EMPTY_SNAPSHOT if replace else self._snapshot
+                # Copies share the existing segments; questions in flight keep
+                # reading the current snapshot's indexes, which stay unchanged
+                corpus = current.vector_index.copy() if current.vector_index is not None else CorpusIndex()
+                keyword_index = current.keyword_index.copy() if current.keyword_index is not None else BM25Index()
+                # Dense and keyword segments are appended in the same order, so
+                # positions line up across both indexes
+                documents = corpus.add(file_id, vector_index, document_name)
+                keyword_index.add(documents, key=file_id)
+                self._publish(corpus, keyword_index)
+            logger.info(f"Vector index loaded: {len(vector_index)} chunks ({vector_index.dtype})")
+            return file_id
         except Exception as e:
             logger.error(f"Error in ingest: {str(e)}")
             raise
 
-    def ask(self, query: str):
-        if not self.vector_store:
-            logger.warning("No vector store found, PDF not ingested")
-            return "Please, add a PDF document first."
+    def remove_document(self, file_id: str) -> bool:
+        """Drop one document from the dense and keyword indexes"""
+        with self._write_lock:
+            current = self._snapshot
+            if current.vector_index is None or file_id not in current.vector_index.file_ids:
+                return False
+            corpus, keyword_index = current.vector_index.copy(), current.keyword_index.copy()
+            corpus.remove(file_id)
+            keyword_index.remove(file_id)
+            self._publish(corpus, keyword_index)
+        logger.info(f"Removed file {file_id}, {len(corpus)} chunks left")
+        return True
+
+    def files(self):
+        snapshot = self._snapshot
+        return snapshot.vector_index.files() if snapshot.vector_index is not None else []
+
+    def manifest(self):
+        """
+        [{"file_id", "name", "directory"}] for reopening this instance's files
+        in another process (backend/registry.py); None if any index lives
+        only in memory
+        """
+        snapshot = self._snapshot
+        if snapshot.vector_index is None:
+            return []
+        files = snapshot.vector_index.files()
+        directories = [index.directory for index in snapshot.vector_index.indexes]
+        if not all(directories):
+            return None
+        return [
+            {"file_id": file["file_id"], "name": file["name"], "directory": directory}
+            for file, directory in zip(files, directories)
+        ]
 
+    def _publish(self, corpus, keyword_index):
+        """Caller holds the write lock. Swap in a snapshot of these indexes."""
+        # Answers are cached per set of indexes (content hash + ingest params)
+        # and file names, which answers cite; any other session holding the
+        # same files shares them. A changed file set is simply a new key.
+        document_key = "+".join(
+            f"{os.path.basename(index.directory) if index.directory else uuid.uuid4().hex}:{file['name']}"
+            for index, file in zip(corpus.indexes, corpus.files())
+        ) or None
+        self._snapshot = IndexSnapshot(corpus, keyword_index, document_key)
+
+    @staticmethod
+    def _cache_key(snapshot: IndexSnapshot, file_ids=None):
+        # Answers over a subset of the files are cached separately; file_ids
+        # are per upload, so the subset is keyed by position in the file set
+        if file_ids is None:
+            return snapshot.document_key
+        wanted = set(file_ids)
+        files = [str(i) for i, file_id in enumerate(snapshot.vector_index.file_ids) if file_id in wanted]
+        return f"{snapshot.document_key}|{','.join(files)}"
+
+    @staticmethod
+    def _cache_entry(snapshot: IndexSnapshot, answer, refs):
+        """Cached answer; its sources name files by position, not by this session's file_ids"""
+        positions = {file_id: i for i, file_id in enumerate(snapshot.vector_index.file_ids)}
+        sources = []
+        for ref in refs:
+            ref = dict(ref)
+            ref["file"] = positions.get(ref.pop("file_id"))
+            sources.append(ref)
+        return {"answer": answer, "sources": sources}
+
+    @staticmethod
+    def _cached_sources(snapshot: IndexSnapshot, cached):
+        """A cached answer's sources, pointing at the asking session's own files"""
+        file_ids = snapshot.vector_index.file_ids
+        sources = []
+        for ref in cached["sources"]:
+            ref = dict(ref)
+            position = ref.pop("file")
+            ref["file_id"] = file_ids[position] if position is not None else None
+            sources.append(ref)
+        return sources
+
+    def structure_positions(self, query: str, file_ids=None, snapshot: IndexSnapshot = None):
+        """
+        Chunks a question points at by page or section ("page 12", "clause 7"),
+        from the structure index, for the retriever to boost; None when it
+        names neither or nothing matches.
+        """
+        snapshot = snapshot or self._snapshot
+        references = parse_structure_query(query)
+        if not references or snapshot.vector_index is None:
+            return None
+        positions = snapshot.vector_index.select(file_ids, **references)
+        if not len(positions):
+            logger.info(f"No chunks match {references}")
+            return None
+        logger.info(f"Boosting {len(positions)}/{len(snapshot.documents)} chunks for {references}")
+        return positions
+
+    def ingest(self, pdf_file_path: str, content_hash: str = None):
+        self.embeddings = get_embedding_service()
+        self.load(prepare_document(pdf_file_path, content_hash, embeddings=self.embeddings))
+
+    def _answer_chain(self, query: str, file_ids=None, snapshot: IndexSnapshot = None):
+        """Classify, retrieve and build the prompt -> model chain for one query"""
         logger.info(f"Processing query: {query}")
         
+        # Embedded once (and usually already cached by the answer-cache lookup):
+        # the router and the retriever share the vector
+        with metrics.span("embed"):
+            query_embedding = self.embeddings.embed_query_vector(query)
+
         # Classify query and get optimal parameters
-        classification = self.classify_query(query)
-        logger.info(f"Query classified as: {classification['type']} - {classification['description']}")
+        with metrics.span("classify"):
+            classification = self.classify_query(query, query_embedding)
+        logger.info(
+            f"Query classified as: {classification['type']} - {classification['description']} "
+            f"({classification['method']}, margin={classification['margin']:.3f})"
+        )
         
+        with metrics.span("structure"):
+            structure_positions = self.structure_positions(query, file_ids, snapshot)
+
         # Create dynamic retriever based on classification
-        dynamic_retriever = self.create_dynamic_retriever(classification['k_value'])
+        with metrics.span("retriever"):
+            dynamic_retriever = self.create_dynamic_retriever(
+                classification['k_value'], file_ids, min_score_ratio=classification['min_score_ratio'],
+                snapshot=snapshot, structure_positions=structure_positions,
+            )
         
         # Get relevant documents with optimized retrieval
-        retrieved_docs = dynamic_retriever.get_relevant_documents(query)
-        
-        logger.info(f"Retrieved {len(retrieved_docs)} chunks for {classification['type']} query")
-        for i, doc in enumerate(retrieved_docs):
+        retrieval = dynamic_retriever.retrieve(query, query_embedding)
+        retrieved_docs = retrieval["documents"]
+        metrics.observe_ms(retrieval["timings"])
+
+        logger.info(
+            f"Retrieved {len(retrieved_docs)} chunks for {classification['type']} query, "
+            f"weights {'/'.join(f'{w:.2f}' for w in retrieval['weights'])}"
+        )
+        logger.info(
+            "Retrieval timings (ms): "
+            + ", ".join(f"{stage}={ms:.1f}" for stage, ms in retrieval["timings"].items())
+        )
+        if LOG_RETRIEVED_CHUNKS:
+            for i, (doc, score) in enumerate(zip(retrieved_docs, retrieval["scores"])):
+                logger.info(
+                    f"Retrieved chunk {i} (score: {score:.4f}): {doc.page_content[:200]}..."
+                )
+
+        # Optional cross-encoder pass: fewer, better chunks for the prompt
+        scores = retrieval["scores"]
+        reranker = get_reranker() if rerank_enabled(classification["type"]) and retrieved_docs else None
+        if reranker is not None:
+            reranked = reranker.rerank(query, retrieved_docs, keep=classification["rerank_keep"])
+            metrics.observe("rerank", reranked["ms"] / 1000)
             logger.info(
-                f"Retrieved chunk {i} (score: {doc.metadata.get('score', 'N/A')}): {doc.page_content[:200]}..."
+                f"Re-ranked {reranked['scored']}/{len(retrieved_docs)} chunks in {reranked['ms']:.0f} ms, "
+                f"kept {len(reranked['documents'])} (~{reranked['tokens_saved']} tokens saved"
+                f"{', over time budget' if reranked['over_budget'] else ''})"
             )
-
-        # Format documents
-        def format_docs(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
+            retrieved_docs, scores = reranked["documents"], reranked["scores"]
+
+        # Overlap-free, best-first, page-cited context within the token budget
+        prompt_start = time.perf_counter()
+        packed = context_packer.pack(retrieved_docs, scores)
+        logger.info(
+            f"Packed context: {len(packed['documents'])}/{len(retrieved_docs)} chunks, "
+            f"~{packed['tokens']} tokens (saved ~{packed['tokens_saved']}; "
+            f"{packed['deduplicated']} trimmed, {packed['dropped']} over budget)"
+        )
         
         # Create chain with dynamic retriever
         chain = (
-            {"context": lambda _: format_docs(retrieved_docs), "question": RunnablePassthrough()}
+            {"context": lambda _: packed["context"], "question": RunnablePassthrough()}
             | self.prompt
             | self.model
             | StrOutputParser()
         )
+        metrics.observe("prompt", time.perf_counter() - prompt_start)
+        return chain, packed["documents"], source_refs(packed["documents"], packed["scores"])
+
+    def ask(self, query: str, sources: list = None, file_ids: list = None):
+        """
+        `sources`, if given, is extended with the retrieved chunks' source refs.
+        `file_ids` limits retrieval to those files (default: all loaded files).
+        """
+        snapshot = self._snapshot  # this question reads only this snapshot
+        if not snapshot.documents:
+            logger.warning("No vector index found, PDF not ingested")
+            return "Please, add a PDF document first."
+
+        with metrics.span("answer_cache"):
+            cached = answer_cache.lookup(self._cache_key(snapshot, file_ids), query, self.embeddings.embed_query_vector)
+        if cached is not None:
+            logger.info(f"Answer cache hit, stats={answer_cache.stats()}")
+            if sources is not None:
+                sources.extend(self._cached_sources(snapshot, cached))
+            return cached["answer"]
+
+        chain, retrieved_docs, refs = self._answer_chain(query, file_ids, snapshot)
+        if sources is not None:
+            sources.extend(refs)
         
         # Get model answer
-        answer = chain.invoke(query)
+        with metrics.span("llm_total"):
+            answer = chain.invoke(query)
+        if answer:
+            answer_cache.store(
+                self._cache_key(snapshot, file_ids), query, self.embeddings.embed_query_vector(query),
+                self._cache_entry(snapshot, answer, refs),
+            )
 
         # Try to capture doc_name (from first retrieved doc's metadata)
         doc_name = None
@@ -307,9 +738,135 @@ class ChatPDF:
 
         return answer
 
+    def ask_stream(self, query: str, sources: list = None, file_ids: list = None):
+        """
+        Same as ask(), but yields answer text as the model produces it.
+        Time-to-first-token is logged; callers join the pieces for the full answer.
+        `sources` is filled before the first piece is yielded.
+        """
+        snapshot = self._snapshot  # this question reads only this snapshot
+        if not snapshot.documents:
+            logger.warning("No vector index found, PDF not ingested")
+            yield "Please, add a PDF document first."
+            return
+
+        with metrics.span("answer_cache"):
+            cached = answer_cache.lookup(self._cache_key(snapshot, file_ids), query, self.embeddings.embed_query_vector)
+        if cached is not None:
+            logger.info(f"Answer cache hit, stats={answer_cache.stats()}")
+            if sources is not None:
+                sources.extend(self._cached_sources(snapshot, cached))
+            yield cached["answer"]
+            return
+
+        start = time.perf_counter()
+        chain, _, refs = self._answer_chain(query, file_ids, snapshot)
+        if sources is not None:
+            sources.extend(refs)
+
+        first_token_ms = None
+        pieces = []
+        llm_start = time.perf_counter()
+        for piece in chain.stream(query):
+            if first_token_ms is None:
+                metrics.observe("llm_first_token", time.perf_counter() - llm_start)
+                first_token_ms = (time.perf_counter() - start) * 1000
+                logger.info(f"Time to first token: {first_token_ms:.0f} ms")
+            pieces.append(piece)
+            yield piece
+        metrics.observe("llm_total", time.perf_counter() - llm_start)
+        logger.info(f"Streamed answer in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        # Only reached when the stream ran to completion
+        answer = "".join(pieces)
+        if answer:
+            answer_cache.store(
+                self._cache_key(snapshot, file_ids), query, self.embeddings.embed_query_vector(query),
+                self._cache_entry(snapshot, answer, refs),
+            )
+
+    async def aask(self, query: str, sources: list = None, file_ids: list = None):
+        """
+        ask() for async servers: cache lookup, embedding and retrieval run in
+        a thread, the model call awaits the gateway's async client.
+        """
+        snapshot = self._snapshot  # this question reads only this snapshot
+        if not snapshot.documents:
+            logger.warning("No vector index found, PDF not ingested")
+            return "Please, add a PDF document first."
+
+        cached = await asyncio.to_thread(
+            answer_cache.lookup, self._cache_key(snapshot, file_ids), query, self.embeddings.embed_query_vector
+        )
+        if cached is not None:
+            if sources is not None:
+                sources.extend(self._cached_sources(snapshot, cached))
+            return cached["answer"]
+
+        chain, _, refs = await asyncio.to_thread(self._answer_chain, query, file_ids, snapshot)
+        if sources is not None:
+            sources.extend(refs)
+
+        start = time.perf_counter()
+        answer = await chain.ainvoke(query)
+        metrics.observe("llm_total", time.perf_counter() - start)
+        if answer:
+            answer_cache.store(
+                self._cache_key(snapshot, file_ids), query, self.embeddings.embed_query_vector(query),
+                self._cache_entry(snapshot, answer, refs),
+            )
+        return answer
+
+    async def aask_stream(self, query: str, sources: list = None, file_ids: list = None):
+        """Async generator version of ask_stream()"""
+        snapshot = self._snapshot  # this question reads only this snapshot
+        if not snapshot.documents:
+            logger.warning("No vector index found, PDF not ingested")
+            yield "Please, add a PDF document first."
+            return
+
+        cached = await asyncio.to_thread(
+            answer_cache.lookup, self._cache_key(snapshot, file_ids), query, self.embeddings.embed_query_vector
+        )
+        if cached is not None:
+            if sources is not None:
+                sources.extend(self._cached_sources(snapshot, cached))
+            yield cached["answer"]
+            return
+
+        chain, _, refs = await asyncio.to_thread(self._answer_chain, query, file_ids, snapshot)
+        if sources is not None:
+            sources.extend(refs)
+
+        pieces = []
+        start = time.perf_counter()
+        async for piece in chain.astream(query):
+            if not pieces:
+                metrics.observe("llm_first_token", time.perf_counter() - start)
+            pieces.append(piece)
+            yield piece
+        metrics.observe("llm_total", time.perf_counter() - start)
+
+        answer = "".join(pieces)
+        if answer:
+            answer_cache.store(
+                self._cache_key(snapshot, file_ids), query, self.embeddings.embed_query_vector(query),
+                self._cache_entry(snapshot, answer, refs),
+            )
+
+    def memory_bytes(self) -> int:
+        """Rough resident size of this instance's index, used for session budgeting"""
+        snapshot = self._snapshot
+        if not snapshot.documents:
+            return 0
+        text_bytes = sum(len(doc.page_content) for doc in snapshot.documents)
+        # Memory-mapped vectors sit in the shared page cache and report 0 here
+        vector_bytes = snapshot.vector_index.resident_bytes
+        keyword_bytes = snapshot.keyword_index.nbytes
+        return text_bytes + vector_bytes + keyword_bytes + snapshot.vector_index.structure_bytes
+
     def clear(self):
-        self.vector_store = None
-        self.retriever = None
-        self.chain = None
-        self._processed_chunks = None
+        # Questions already running finish on the snapshot they started with
+        with self._write_lock:
+            self._snapshot = EMPTY_SNAPSHOT
         logger.info("Session cleared")
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Shared by every gunicorn worker on the host (like INGEST_CACHE_DIR, which
+# holds the index directories recorded here)
+DOCUMENT_REGISTRY_DIR = os.getenv("DOCUMENT_REGISTRY_DIR", os.path.join(tempfile.gettempdir(), "rag_documents"))
+
+# Document and job ids are uuid4().hex; anything else never reaches the filesystem
+_ID = re.compile(r"^[0-9a-f]{32}$")
+
+JOB_FIELDS = ("id", "state", "stage", "percent", "document_id", "file_id", "error")
+
+
+class DocumentRegistry:
+    """
+    On-disk record of which index directories make up each user's document,
+    and of each ingest job's outcome, so any worker (or a restarted one) can
+    reopen a document's memory-mapped indexes and report a job it did not run.
+
+    One small JSON file per document and per job, written atomically
+    (temp file + rename); readers never see a partial record.
+    """
+
+    def __init__(self, root=DOCUMENT_REGISTRY_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "documents"), exist_ok=True)
+        os.makedirs(os.path.join(root, "jobs"), exist_ok=True)
+
+    def _user_dir(self, user_id):
+        return os.path.join(self.root, "documents", hashlib.sha256(str(user_id).encode()).hexdigest()[:32])
+
+    def _document_path(self, user_id, document_id):
+        return os.path.join(self._user_dir(user_id), f"{document_id}.json")
+
+    def _job_path(self, job_id):
+        return os.path.join(self.root, "jobs", f"{job_id}.json")
+
+    def put_document(self, user_id, document_id, document_name, files):
+        """`files`: [{"file_id", "name", "directory"}], in the order they were added"""
+        if not _ID.match(document_id or ""):
+            return
+        record = {"document_id": document_id, "document_name": document_name, "files": files}
+        self._write(self._document_path(user_id, document_id), record)
+
+    def get_document(self, user_id, document_id=None):
+        """The document's record, or the user's most recently written one when document_id is None"""
+        if document_id is None:
+            document_id = self._latest_document_id(user_id)
+        if not _ID.match(document_id or ""):
+            return None
+        return self._read(self._document_path(user_id, document_id))
+
+    def remove_document(self, user_id, document_id=None):
+        if document_id is None:
+            names = self._listdir(self._user_dir(user_id))
+        elif _ID.match(document_id):
+            names = [f"{document_id}.json"]
+        else:
+            names = []
+        for name in names:
+            try:
+                os.remove(os.path.join(self._user_dir(user_id), name))
+            except OSError:
+                pass
+
+    def put_job(self, user_id, job):
+        self._write(self._job_path(job["id"]), dict({key: job[key] for key in JOB_FIELDS}, user_id=user_id))
+
+    def get_job(self, user_id, job_id):
+        if not _ID.match(job_id or ""):
+            return None
+        record = self._read(self._job_path(job_id))
+        if record is None or record.get("user_id") != user_id:
+            return None
+        return {key: record.get(key) for key in JOB_FIELDS}
+
+    def prune_jobs(self, max_age_seconds):
+        cutoff = time.time() - max_age_seconds
+        jobs_dir = os.path.join(self.root, "jobs")
+        for name in self._listdir(jobs_dir):
+            path = os.path.join(jobs_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def _latest_document_id(self, user_id):
+        user_dir = self._user_dir(user_id)
+        latest, latest_mtime = None, -1.0
+        for name in self._listdir(user_dir):
+            try:
+                mtime = os.path.getmtime(os.path.join(user_dir, name))
+            except OSError:
+                continue
+            if mtime > latest_mtime:
+                latest, latest_mtime = name[:-len(".json")], mtime
+        return latest
+
+    @staticmethod
+    def _listdir(path):
+        try:
+            return [name for name in os.listdir(path) if name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _write(path, record):
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Could not write registry record {path}: {str(e)}")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from backend.context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Query classes (backend/router.py) that get re-ranked, comma-separated; empty = off
+RERANK_CLASSES = {name.strip() for name in os.getenv("RERANK_CLASSES", "").split(",") if name.strip()}
+# "torch" (sentence-transformers CrossEncoder) or "onnx" (onnxruntime on an exported model)
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch")
+RERANK_ONNX_PATH = os.getenv("RERANK_ONNX_PATH")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+# Per query; batches stop once it is spent (the first batch always runs)
+RERANK_TIME_BUDGET_MS = float(os.getenv("RERANK_TIME_BUDGET_MS", "300"))
+# Drop re-ranked chunks scoring below this logit (unset = keep the top `keep`)
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE")) if os.getenv("RERANK_MIN_SCORE") else None
+
+_reranker = None
+_reranker_failed = False
+_reranker_lock = threading.Lock()
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk) pairs with a small cross-encoder and keeps the
+    best `keep` chunks. Candidates are scored in fused-rank order, in
+    batches, until the time budget runs out; chunks left unscored rank
+    below every scored one, in their fused order, and only fill the kept
+    set when no scored chunk fell below `min_score`.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, backend=RERANK_BACKEND, onnx_path=RERANK_ONNX_PATH,
+                 batch_size=RERANK_BATCH_SIZE, max_length=RERANK_MAX_LENGTH):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.candidates = 0
+        self.scored = 0
+        self.kept = 0
+        self.over_budget = 0
+        self.tokens_saved = 0
+
+        if backend == "onnx" and not onnx_path:
+            logger.warning("RERANK_BACKEND=onnx but RERANK_ONNX_PATH not set, using torch")
+            backend = "torch"
+        self.backend = backend
+
+        if backend == "onnx":
+            import onnxruntime
+            from transformers import AutoTokenizer
+
+            self._session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+            self._input_names = {i.name for i in self._session.get_inputs()}
+            self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+        else:
+            from sentence_transformers import CrossEncoder
+
+            self._model = CrossEncoder(model_name, max_length=max_length)
+        logger.info(f"Re-ranker loaded: {model_name} ({self.backend}, batch_size={batch_size})")
+
+    def score(self, query: str, texts) -> np.ndarray:
+        """One relevance logit per text"""
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        if self.backend == "onnx":
+            tokens = self._tokenizer(
+                [query] * len(texts),
+                list(texts),
+                padding=True,
+                truncation="only_second",
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feed = {name: value.astype(np.int64) for name, value in tokens.items() if name in self._input_names}
+            return self._session.run(None, feed)[0].reshape(len(texts), -1)[:, 0].astype(np.float32)
+        return np.asarray(
+            self._model.predict([(query, text) for text in texts], batch_size=self.batch_size, show_progress_bar=False),
+            dtype=np.float32,
+        ).reshape(len(texts))
+
+    def rerank(self, query: str, documents, keep: int, time_budget_ms=RERANK_TIME_BUDGET_MS,
+               min_score=RERANK_MIN_SCORE) -> dict:
+        """
+        `documents` in fused order. Returns {"documents", "scores", "scored",
+        "over_budget", "tokens_saved", "ms"}; scores are cross-encoder logits,
+        and unscored chunks get scores below the lowest logit.
+        """
+        start = time.perf_counter()
+        deadline = start + time_budget_ms / 1000
+        logits = []
+        over_budget = False
+        for batch_start in range(0, len(documents), self.batch_size):
+            if batch_start and time.perf_counter() >= deadline:
+                over_budget = True
+                break
+            batch = documents[batch_start:batch_start + self.batch_size]
+            logits.extend(self.score(query, [doc.page_content for doc in batch]).tolist())
+
+        scored = np.asarray(logits, dtype=np.float32)
+        order = np.argsort(-scored, kind="stable")
+        rejected = 0
+        if min_score is not None:
+            passing = order[scored[order] >= min_score]
+            rejected = len(order) - len(passing)
+            order = passing
+        positions = order.tolist()[:keep]
+        scores = scored[positions].tolist()
+        # Fill from the unscored tail, keeping fused order, only when the time
+        # budget left fewer than `keep` chunks scored: unscored chunks never
+        # take the place of ones the cross-encoder scored below min_score
+        floor = min(scores) if scores else 0.0
+        for offset, position in enumerate(range(len(scored), len(documents))):
+            if len(positions) >= keep or rejected:
+                break
+            positions.append(position)
+            scores.append(floor - 1.0 - offset)
+
+        kept = [documents[i] for i in positions]
+        kept_ids = set(positions)
+        tokens_saved = sum(
+            estimate_tokens(doc.page_content) for i, doc in enumerate(documents) if i not in kept_ids
+        )
+        with self._lock:
+            self.queries += 1
+            self.candidates += len(documents)
+            self.scored += len(scored)
+            self.kept += len(kept)
+            self.over_budget += over_budget
+            self.tokens_saved += tokens_saved
+
+        return {
+            "documents": kept,
+            "scores": scores,
+            "scored": len(scored),
+            "over_budget": over_budget,
+            "tokens_saved": tokens_saved,
+            "ms": (time.perf_counter() - start) * 1000,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "queries": self.queries,
+                "candidates": self.candidates,
+                "scored": self.scored,
+                "kept": self.kept,
+                "over_budget": self.over_budget,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+def rerank_enabled(query_type: str) -> bool:
+    return query_type in RERANK_CLASSES
+
+
+def get_reranker():
+    """The process-wide re-ranker, or None if it could not be loaded (logged once)"""
+    global _reranker, _reranker_failed
+    if _reranker is None and not _reranker_failed:
+        with _reranker_lock:
+            if _reranker is None and not _reranker_failed:
+                try:
+                    _reranker = CrossEncoderReranker()
+                except Exception as e:
+                    _reranker_failed = True
+                    logger.error(f"Re-ranker unavailable, continuing without it: {str(e)}")
+    return _reranker
+
+
+def loaded_reranker():
+    """The re-ranker if this process has loaded it, else None (never loads the model)"""
+    return _reranker
@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Below this cosine margin between the two nearest classes the keyword rules decide
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.02"))
+
+# Retrieval settings per class. k_value is the ceiling; retrieval stops early
+# once fused scores fall below min_score_ratio x the best fused score. Fused
+# scores are rank-based, so this mostly drops hits found by only one retriever
+# deep in its list; broad classes keep a low ratio to protect recall.
+# Fusion weights are not per class: every query starts from the 0.5/0.3/0.2
+# default and adapts to its own score distribution (rag.adaptive_weights)
+# rerank_keep: chunks kept by the cross-encoder, for classes in RERANK_CLASSES
+QUERY_CLASSES = {
+    "factual": {
+        "k_value": 8,
+        "description": "Factual extraction - focused retrieval",
+        "min_score_ratio": 0.3,
+        "rerank_keep": 4,
+    },
+    "analysis": {
+        "k_value": 22,
+        "description": "Legal analysis - comprehensive retrieval",
+        "min_score_ratio": 0.1,
+        "rerank_keep": 10,
+    },
+    "process": {
+        "k_value": 15,
+        "description": "Process/mechanism - moderate retrieval",
+        "min_score_ratio": 0.15,
+        "rerank_keep": 8,
+    },
+    "general": {
+        "k_value": 18,
+        "description": "General query - balanced retrieval",
+        "min_score_ratio": 0.15,
+        "rerank_keep": 8,
+    },
+}
+
+# Labelled example questions; each class is routed to by its mean embedding
+ROUTER_EXEMPLARS = {
+    "factual": [
+        "What was the sum assured under the policy?",
+        "When was the policy issued?",
+        "What is the policy number?",
+        "How much premium was paid each year?",
+        "On what date did the policy lapse?",
+        "What amount did the insurer pay out?",
+        "Who is the nominee under the policy?",
+        "What is the date of the repudiation letter?",
+        "Who are the complainant and the respondent?",
+        "How much compensation was awarded?",
+    ],
+    "analysis": [
+        "Why did the insurer reject the claim?",
+        "On what grounds was the complaint dismissed?",
+        "What are the main legal arguments of the respondent?",
+        "Was the repudiation of the claim justified?",
+        "Why was the premium payment missed and does it matter?",
+        "Is the insurer liable despite the non-disclosure?",
+        "What precedents did the complainant rely on?",
+        "Did the insurer breach the terms of the policy?",
+        "What was the legal basis for the ombudsman's decision?",
+        "How strong is the complainant's case?",
+    ],
+    "process": [
+        "How can a lapsed policy be revived?",
+        "What is the procedure for filing a complaint with the ombudsman?",
+        "Under what conditions can the claim be reopened?",
+        "What steps must the insured take to intimate a claim?",
+        "What documents are required to settle the claim?",
+        "When can the insurer cancel the policy?",
+        "How is the surrender value calculated?",
+        "What is the process for appealing the award?",
+        "What are the requirements for a valid nomination?",
+        "How does the grace period for premium payment work?",
+    ],
+    "general": [
+        "Summarize this document.",
+        "What is this case about?",
+        "Give me an overview of the dispute.",
+        "Explain the background of the matter.",
+        "What happened in this case?",
+        "Tell me about the parties involved.",
+        "What are the key points of the order?",
+        "Describe the timeline of events.",
+        "What is the outcome of the proceedings?",
+        "Anything else important in this document?",
+    ],
+}
+
+# The original substring rules, kept for ambiguous embeddings
+KEYWORD_PATTERNS = [
+    ("factual", [
+        "what was", "when did", "amount", "date", "number", "premium",
+        "policy number", "sum assured", "issue date", "lapse date",
+        "payment history", "specific", "exactly",
+    ]),
+    ("analysis", [
+        "grounds for", "legal basis", "precedent", "arguments", "why",
+        "dismiss", "reject", "defense", "liability", "breach",
+        "key legal", "main reasons", "basis for",
+    ]),
+    ("process", [
+        "circumstances", "under what", "how can", "when can", "process",
+        "procedure", "steps", "mechanism", "conditions", "requirements",
+    ]),
+]
+
+
+def keyword_route(query: str) -> str:
+    query_lower = query.lower()
+    for query_type, patterns in KEYWORD_PATTERNS:
+        if any(pattern in query_lower for pattern in patterns):
+            return query_type
+    return "general"
+
+
+class QueryRouter:
+    """
+    Nearest-centroid query classifier over the query embedding retrieval
+    computes anyway, so routing costs one (classes x dim) matvec.
+
+    Centroids are the normalized mean exemplar embeddings per class,
+    encoded once per process and embedding model. When the best and second
+    best class are closer than `min_margin`, the keyword rules decide.
+    """
+
+    def __init__(self, exemplars=ROUTER_EXEMPLARS, classes=QUERY_CLASSES, min_margin=ROUTER_MIN_MARGIN):
+        self.exemplars = exemplars
+        self.classes = classes
+        self.min_margin = min_margin
+        self._labels = list(exemplars)
+        self._centroids = {}  # embeddings cache_tag -> (classes, dim)
+        self._lock = threading.Lock()
+
+    def centroids(self, embeddings) -> np.ndarray:
+        tag = getattr(embeddings, "cache_tag", None) or id(embeddings)
+        centroids = self._centroids.get(tag)
+        if centroids is None:
+            with self._lock:
+                centroids = self._centroids.get(tag)
+                if centroids is None:
+                    texts = [text for label in self._labels for text in self.exemplars[label]]
+                    vectors = np.asarray(embeddings.encode(texts), dtype=np.float32)
+                    rows, start = [], 0
+                    for label in self._labels:
+                        n = len(self.exemplars[label])
+                        rows.append(vectors[start:start + n].mean(axis=0))
+                        start += n
+                    centroids = np.vstack(rows)
+                    centroids /= np.clip(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12, None)
+                    self._centroids[tag] = centroids
+                    logger.info(f"Query router centroids built from {len(texts)} exemplars")
+        return centroids
+
+    def route(self, query: str, query_embedding, embeddings) -> dict:
+        """
+        Returns {"type", "k_value", "description", "min_score_ratio",
+        "rerank_keep", "confidence", "margin", "method"}
+        """
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        similarity = self.centroids(embeddings) @ (vector / (np.linalg.norm(vector) or 1.0))
+        best, second = np.argsort(-similarity)[:2]
+        margin = float(similarity[best] - similarity[second])
+
+        if margin >= self.min_margin:
+            query_type, method = self._labels[best], "embedding"
+        else:
+            query_type, method = keyword_route(query), "keywords"
+        return dict(
+            self.classes[query_type],
+            type=query_type,
+            confidence=float(similarity[best]),
+            margin=margin,
+            method=method,
+        )
+
+
+query_router = QueryRouter()
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Per-process budget; each gunicorn worker holds its own store
+SESSION_MEMORY_BUDGET_MB = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "1024"))
+SESSION_IDLE_TTL_SECONDS = int(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600"))
+
+
+class SessionStore:
+    """
+    Per-user, per-document ChatPDF instances.
+
+    Entries are kept in LRU order and evicted when idle longer than
+    `idle_ttl_seconds` or when the summed index size exceeds
+    `memory_budget_bytes`. Ingest happens outside the store; only the
+    finished ChatPDF is inserted, so the lock is never held during ingest.
+
+    With a `registry` (backend/registry.py), every put records the
+    document's index directories on disk, and every get checks the entry
+    against that record: a miss in memory (another worker's document, a
+    restart, an evicted session) or a file list another worker has since
+    changed rebuilds the ChatPDF with `restore(record)`, outside the lock,
+    and a record that is gone (reset elsewhere) drops the entry.
+    """
+
+    def __init__(self, memory_budget_bytes=None, idle_ttl_seconds=None, registry=None, restore=None):
+        if memory_budget_bytes is None:
+            memory_budget_bytes = SESSION_MEMORY_BUDGET_MB * 1024 * 1024
+        if idle_ttl_seconds is None:
+            idle_ttl_seconds = SESSION_IDLE_TTL_SECONDS
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._entries = OrderedDict()  # (user_id, document_id) -> entry dict
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.registry = registry
+        self.restore = restore
+
+    @staticmethod
+    def new_document_id():
+        return uuid.uuid4().hex
+
+    def put(self, user_id, document_id, chatpdf, document_name=None):
+        files = chatpdf.manifest() if self.registry is not None else None
+        entry = self._insert(user_id, document_id, chatpdf, document_name, files)
+        if files is not None:
+            self.registry.put_document(user_id, document_id, document_name, files)
+        return entry
+
+    def _insert(self, user_id, document_id, chatpdf, document_name, files=None):
+        entry = {
+            "chatpdf": chatpdf,
+            "document_name": document_name,
+            # The registry file list this instance was built from; None if unregistered
+            "files": files,
+            "bytes": chatpdf.memory_bytes(),
+            "last_used": time.monotonic(),
+        }
+        key = (user_id, document_id)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old["bytes"]
+            self._entries[key] = entry
+            self._bytes += entry["bytes"]
+            self._evict(keep=key)
+        logger.info(f"Session stored for user {user_id}, document {document_id} ({entry['bytes'] / 1e6:.1f} MB)")
+        return entry
+
+    def get(self, user_id, document_id=None):
+        """
+        Return the entry for the document, or the user's most recently used
+        document when document_id is None. Returns None if not loaded here
+        and not restorable from the registry, or if another worker removed it.
+        """
+        with self._lock:
+            self._evict()
+            key = (user_id, document_id) if document_id else self._latest_key(user_id)
+            entry = self._entries.get(key) if key else None
+            if entry is not None:
+                entry["last_used"] = time.monotonic()
+                self._entries.move_to_end(key)
+        if entry is None:
+            return self._restore(user_id, document_id)
+        if entry["files"] is None:
+            return dict(entry, document_id=key[1])
+
+        # Another worker may have appended, removed or reset since this was built
+        record = self.registry.get_document(user_id, key[1])
+        if record is None:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._drop(key)
+            logger.info(f"Session dropped, document removed by another worker: {key}")
+            return None
+        if record["files"] != entry["files"]:
+            return self._restore(user_id, key[1], record)
+        return dict(entry, document_id=key[1])
+
+    def _restore(self, user_id, document_id, record=None):
+        if self.registry is None or self.restore is None:
+            return None
+        if record is None:
+            record = self.registry.get_document(user_id, document_id)
+        if record is None:
+            return None
+        try:
+            chatpdf = self.restore(record)
+        except (FileNotFoundError, ValueError, OSError) as e:
+            # An index directory is gone (ingest cache eviction, new host)
+            logger.warning(f"Could not restore document {record['document_id']}: {str(e)}")
+            self.registry.remove_document(user_id, record["document_id"])
+            with self._lock:
+                self._drop((user_id, record["document_id"]))
+            return None
+        entry = self._insert(user_id, record["document_id"], chatpdf, record["document_name"], record["files"])
+        logger.info(f"Session restored from registry for user {user_id}, document {record['document_id']}")
+        return dict(entry, document_id=record["document_id"])
+
+    def remove(self, user_id, document_id=None):
+        """Drop one document, or all of the user's documents. Returns count removed."""
+        if self.registry is not None:
+            self.registry.remove_document(user_id, document_id)
+        with self._lock:
+            if document_id:
+                keys = [(user_id, document_id)]
+            else:
+                keys = [key for key in self._entries if key[0] == user_id]
+            removed = 0
+            for key in keys:
+                if self._drop(key):
+                    removed += 1
+            return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+            }
+
+    def _latest_key(self, user_id):
+        for key in reversed(self._entries):
+            if key[0] == user_id:
+                return key
+        return None
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        # No clear(): a request may still be answering from this instance;
+        # dropping the reference is enough to release its index
+        self._bytes -= entry["bytes"]
+        return True
+
+    def _evict(self, keep=None):
+        """Caller holds the lock. Expire idle entries, then trim LRU to budget."""
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if now - entry["last_used"] > self.idle_ttl_seconds:
+                self._drop(key)
+                logger.info(f"Session expired: {key}")
+
+        while self._bytes > self.memory_budget_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._drop(key)
+            logger.info(f"Session evicted for memory budget: {key}")
@@ -0,0 +1,219 @@
+import re
+
+import numpy as np
+
+# Bump when chunk_structure() changes; part of the ingest cache key
+STRUCTURE_FORMAT_VERSION = 1
+
+# Element categories unstructured emits; anything else maps to "Other"
+ELEMENT_TYPES = [
+    "Title", "NarrativeText", "ListItem", "Table", "Header", "Footer", "FigureCaption",
+    "Image", "Formula", "Address", "EmailAddress", "PageNumber", "UncategorizedText", "Other",
+]
+_TYPE_BITS = {name: 1 << i for i, name in enumerate(ELEMENT_TYPES)}
+
+SECTION_WORDS = r"clause|section|article|part|chapter|schedule|annexure|annex|appendix|paragraph|para"
+# Heading labels: "7", "7.2", "Clause 7", "SECTION 12.", "Annexure A", "Part IV"
+_HEADING_LABEL = re.compile(
+    rf"^\s*(?:(?:{SECTION_WORDS})\s+([0-9]+(?:\.[0-9]+)*|[ivxlc]+|[a-z])\b|([0-9]+(?:\.[0-9]+)*)(?:[.)\s]|$))",
+    re.IGNORECASE,
+)
+_QUERY_SECTION = re.compile(rf"\b(?:{SECTION_WORDS})\s+([0-9]+(?:\.[0-9]+)*|[ivxlc]+|[a-z])\b", re.IGNORECASE)
+# "section 45 of the Insurance Act" cites a statute, not this document
+_STATUTE_SUFFIX = re.compile(
+    r"\s*(?:\([0-9a-z]+\)\s*)*,?\s+of\s+(?:the\s+)?(?:[\w().,&'-]+\s+){0,6}?(?:act|rules|regulations|code|ordinance)\b",
+    re.IGNORECASE,
+)
+# "12.03.2019 Order" is a date, not section 12
+_DATE_LIKE = re.compile(r"^\d{1,4}[./-]\d{1,2}[./-]\d{2,4}$")
+_QUERY_PAGE = re.compile(r"\b(?:pages?|pp?\.)\s*([0-9]+)(?:\s*(?:-|–|to)\s*([0-9]+))?", re.IGNORECASE)
+# "pages 1-900" is not a targeted question; wider page ranges are ignored
+MAX_QUERY_PAGES = 20
+
+
+def chunk_structure(chunk, section=None) -> dict:
+    """
+    Scalar structure fields for one chunk_by_title chunk, from its original
+    elements: {"page_start", "page_end", "section", "element_types"}.
+    `section` is the heading in force before this chunk; chunk_by_title
+    starts a chunk at every Title, so a chunk's own Title replaces it.
+    """
+    elements = getattr(chunk.metadata, "orig_elements", None) or [chunk]
+    pages = [e.metadata.page_number for e in elements if e.metadata.page_number is not None]
+    types = {getattr(e, "category", None) or "Other" for e in elements}
+    for element in elements:
+        if getattr(element, "category", None) == "Title" and element.text.strip():
+            section = " ".join(element.text.split())[:200]
+            break
+    return {
+        "page_start": min(pages) if pages else None,
+        "page_end": max(pages) if pages else None,
+        "section": section,
+        "element_types": ",".join(sorted(types)),
+    }
+
+
+def heading_labels(heading: str):
+    """Numbers a heading can be cited by: "7.2 Revival" -> {"7.2", "7"}"""
+    match = _HEADING_LABEL.match(heading or "")
+    if not match:
+        return set()
+    label = (match.group(1) or match.group(2)).lower()
+    parts = label.split(".")
+    if _DATE_LIKE.match(label) or any(len(part) > 3 for part in parts):
+        return set()  # dates and years
+    return {".".join(parts[:i]) for i in range(1, len(parts) + 1)}
+
+
+def parse_structure_query(query: str) -> dict:
+    """
+    Page and section references in a question: "what does clause 7 say on
+    page 12" -> {"pages": [12], "sections": ["7"]}. Empty dict if none.
+    """
+    pages = []
+    for match in _QUERY_PAGE.finditer(query):
+        first = int(match.group(1))
+        last = int(match.group(2)) if match.group(2) else first
+        if first <= last < first + MAX_QUERY_PAGES:
+            pages.extend(range(first, last + 1))
+    sections = []
+    for match in _QUERY_SECTION.finditer(query):
+        label, rest = match.group(1), query[match.end():]
+        if _STATUTE_SUFFIX.match(rest):
+            continue
+        # "schedule a hearing", "part i think": one lower-case letter counts
+        # only at the end of the question ("what does annexure a say" doesn't)
+        if len(label) == 1 and not label.isdigit() and label.islower() and rest.strip(" ?.!"):
+            continue
+        sections.append(label.lower())
+    found = {}
+    if pages:
+        found["pages"] = sorted(set(pages))
+    if sections:
+        found["sections"] = list(dict.fromkeys(sections))
+    return found
+
+
+def _group(keys, rows, n_keys):
+    """CSR grouping: positions for key j are out[ptr[j]:ptr[j + 1]], ascending"""
+    order = np.lexsort((rows, keys))
+    ptr = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=ptr[1:])
+    return rows[order].astype(np.int32), ptr
+
+
+class StructureIndex:
+    """
+    Columnar page/section/element-type metadata for one document's chunks.
+
+    One array entry per chunk (page range, section id, element-type bit
+    mask) plus CSR-style inverted indexes from page, section and element
+    type to chunk positions, so "page 12" or "clause 7" resolves to its
+    chunks by binary search and a slice instead of a scan over every
+    chunk's metadata dict. Built once per document at load time; immutable.
+    """
+
+    def __init__(self, documents):
+        n = len(documents)
+        self.page_start = np.zeros(n, dtype=np.int32)  # 0 = unknown page
+        self.page_end = np.zeros(n, dtype=np.int32)
+        self.section_id = np.full(n, -1, dtype=np.int32)
+        self.type_mask = np.zeros(n, dtype=np.uint16)
+        self.sections = []  # section id -> heading
+        section_ids, labels = {}, {}
+
+        for i, doc in enumerate(documents):
+            metadata = doc.metadata
+            # Chunks cached before these fields existed only have page_number
+            start = metadata.get("page_start", metadata.get("page_number")) or 0
+            self.page_start[i] = start
+            self.page_end[i] = max(metadata.get("page_end") or start, start)
+            heading = metadata.get("section")
+            if heading:
+                if heading not in section_ids:
+                    section_ids[heading] = len(self.sections)
+                    self.sections.append(heading)
+                    for label in heading_labels(heading):
+                        labels.setdefault(label, []).append(section_ids[heading])
+                self.section_id[i] = section_ids[heading]
+            for name in (metadata.get("element_types") or "").split(","):
+                if name:
+                    self.type_mask[i] |= _TYPE_BITS.get(name, _TYPE_BITS["Other"])
+        self._labels = {label: np.asarray(ids, dtype=np.int32) for label, ids in labels.items()}
+
+        rows = np.arange(n, dtype=np.int64)
+        # Page -> chunks: a chunk spanning pages 3-4 is listed under both
+        spans = (self.page_end - self.page_start + 1).astype(np.int64)
+        page_rows = np.repeat(rows, spans)
+        page_keys = np.repeat(self.page_start.astype(np.int64), spans) + (
+            np.arange(len(page_rows)) - np.repeat(np.cumsum(spans) - spans, spans)
+        )
+        self.max_page = int(self.page_end.max()) if n else 0
+        self._page_rows, self._page_ptr = _group(page_keys, page_rows, self.max_page + 1)
+
+        known = self.section_id >= 0
+        self._section_rows, self._section_ptr = _group(
+            self.section_id[known].astype(np.int64), rows[known], len(self.sections)
+        )
+
+        bits = np.arange(len(ELEMENT_TYPES), dtype=np.uint16)
+        has_type = (self.type_mask[:, None] >> bits) & 1
+        type_rows, type_keys = np.nonzero(has_type)
+        self._type_rows, self._type_ptr = _group(type_keys.astype(np.int64), type_rows, len(ELEMENT_TYPES))
+
+    def __len__(self):
+        return len(self.page_start)
+
+    def pages(self, pages) -> np.ndarray:
+        """Chunks on any of `pages`"""
+        wanted = [p for p in pages if 0 < p <= self.max_page]
+        return self._union(self._page_rows, self._page_ptr, wanted)
+
+    def sections_for(self, label: str):
+        """Section ids whose heading is cited as `label`; "12.4" falls back to "12" if no 12.4 heading exists"""
+        parts = label.lower().split(".")
+        for end in range(len(parts), 0, -1):
+            ids = self._labels.get(".".join(parts[:end]))
+            if ids is not None:
+                return ids
+        return np.empty(0, dtype=np.int32)
+
+    def section(self, label: str) -> np.ndarray:
+        """Chunks under the heading(s) cited as `label` ("7", "7.2", "a", "iv")"""
+        return self._union(self._section_rows, self._section_ptr, self.sections_for(label))
+
+    def element_type(self, names) -> np.ndarray:
+        """Chunks containing any of the element types `names` (e.g. ["Table"])"""
+        ids = [ELEMENT_TYPES.index(name) for name in names if name in _TYPE_BITS]
+        return self._union(self._type_rows, self._type_ptr, ids)
+
+    def select(self, pages=None, sections=None, element_types=None):
+        """
+        Chunk positions matching every given filter (each filter matches
+        any of its values); None when no filter is given.
+        """
+        selected = None
+        for filtered in (
+            self.pages(pages) if pages else None,
+            np.unique(np.concatenate([self.section(label) for label in sections])) if sections else None,
+            self.element_type(element_types) if element_types else None,
+        ):
+            if filtered is not None:
+                selected = filtered if selected is None else np.intersect1d(selected, filtered, assume_unique=True)
+        return selected
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (
+            self.page_start, self.page_end, self.section_id, self.type_mask,
+            self._page_rows, self._page_ptr, self._section_rows, self._section_ptr,
+            self._type_rows, self._type_ptr,
+        )
+        return sum(a.nbytes for a in arrays) + sum(len(s) for s in self.sections)
+
+    @staticmethod
+    def _union(rows, ptr, keys) -> np.ndarray:
+        parts = [rows[ptr[key]:ptr[key + 1]] for key in keys]
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        return parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
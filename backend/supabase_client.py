@@ -4,7 +4,12 @@ from supabase import create_client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-supabase = create_client(
-    SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY
-)
+if os.getenv("SUPABASE_FAKE") == "1":
+    # Local runs / benchmarks without a Supabase project
+    from backend.fake_supabase import FakeSupabase
+    supabase = FakeSupabase()
+else:
+    supabase = create_client(
+        SUPABASE_URL,
+        SUPABASE_SERVICE_ROLE_KEY
+    )
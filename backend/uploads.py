@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+from flask import Request
+from pypdf import PdfReader
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "50"))
+MAX_UPLOAD_PAGES = int(os.getenv("MAX_UPLOAD_PAGES", "1000"))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "rag_uploads"))
+# Files this old in UPLOAD_DIR are leftovers from a crashed worker
+UPLOAD_STALE_SECONDS = int(os.getenv("UPLOAD_STALE_SECONDS", "86400"))
+
+PDF_MAGIC = b"%PDF-"
+# Readers accept a little junk before the header; anything longer is not a PDF
+PDF_HEADER_WINDOW = 1024
+
+
+class UploadFile:
+    """
+    Writable temp file in UPLOAD_DIR that werkzeug streams a multipart file
+    part into, 64 KiB at a time. The SHA-256 (the ingest cache key) and the
+    size are computed as bytes arrive; the upload is rejected, and its file
+    deleted, as soon as it passes `max_bytes` or its header isn't a PDF's.
+    """
+
+    def __init__(self, max_bytes):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_DIR)
+        self._file = os.fdopen(fd, "w+b")
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.claimed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.discard()
+            raise RequestEntityTooLarge(f"File too large (max {self.max_bytes // (1024 * 1024)} MB)")
+        if len(self._head) < PDF_HEADER_WINDOW:
+            self._head += data[:PDF_HEADER_WINDOW - len(self._head)]
+            if len(self._head) >= PDF_HEADER_WINDOW and PDF_MAGIC not in self._head:
+                self.discard()
+                raise UnsupportedMediaType("Only PDF files are supported")
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        # read/readline/seek/tell/flush for werkzeug's FileStorage
+        return getattr(self._file, name)
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def claim(self):
+        """Hand the file on (e.g. to an ingest job, which deletes it when done)"""
+        self._file.close()
+        self.claimed = True
+        return self.path
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class UploadRequest(Request):
+    """Flask request class streaming file uploads into UploadFiles (flat memory, one disk copy)."""
+
+    max_upload_bytes = MAX_UPLOAD_MB * 1024 * 1024
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        upload = UploadFile(self.max_upload_bytes)
+        self.__dict__.setdefault("_uploads", []).append(upload)
+        return upload
+
+    def discard_unclaimed_uploads(self):
+        for upload in self.__dict__.get("_uploads", ()):
+            if not upload.claimed:
+                upload.discard()
+
+
+def count_pages(path: str) -> int:
+    """Page count of a complete upload; ValueError if it isn't a readable PDF"""
+    with open(path, "rb") as f:
+        if PDF_MAGIC not in f.read(PDF_HEADER_WINDOW):
+            raise ValueError("Only PDF files are supported")
+    try:
+        # Reads the xref and page tree only, not the page contents
+        return len(PdfReader(path).pages)
+    except Exception as e:
+        raise ValueError(f"Not a readable PDF: {str(e)}")
+
+
+def sweep_stale_uploads():
+    """Delete uploads a crashed worker left behind"""
+    if not os.path.isdir(UPLOAD_DIR):
+        return
+    cutoff = time.time() - UPLOAD_STALE_SECONDS
+    removed = 0
+    for name in os.listdir(UPLOAD_DIR):
+        path = os.path.join(UPLOAD_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} stale uploads from {UPLOAD_DIR}")
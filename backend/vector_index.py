@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# float32 | float16 | int8 (per-row symmetric scale)
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+INDEX_FORMAT_VERSION = 1
+SEARCH_BLOCK_ROWS = 16384
+
+CHUNKS_FILE = "chunks.json"
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+META_FILE = "meta.json"
+
+
+def quantize(vectors, dtype: str):
+    """Returns (stored matrix, per-row scales or None)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unsupported vector index dtype: {dtype}")
+
+
+class VectorIndex:
+    """
+    Dense index over one document's chunks: an (n, dim) matrix of normalized
+    embeddings, optionally float16/int8, plus the chunk texts and metadata.
+
+    Saved indexes are opened with np.load(mmap_mode="r"), so opening is
+    near-instant and every process that opens the same directory shares the
+    pages through the OS page cache instead of holding its own copy.
+    """
+
+    def __init__(self, documents, vectors, scales=None, directory=None):
+        self.documents = documents
+        self.matrix = vectors
+        self.scales = scales
+        self.directory = directory
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __reduce__(self):
+        # Crossing a process boundary: reopen the files instead of copying the matrix
+        if self.directory:
+            return (VectorIndex.load, (self.directory,))
+        return (VectorIndex, (self.documents, np.asarray(self.matrix), self.scales))
+
+    @property
+    def dtype(self) -> str:
+        return "int8" if self.scales is not None else str(self.matrix.dtype)
+
+    @property
+    def resident_bytes(self) -> int:
+        """Private memory held by this index; mmapped vectors live in the shared page cache"""
+        if isinstance(self.matrix, np.memmap):
+            return 0
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @classmethod
+    def save(cls, directory: str, documents, vectors, dtype: str = VECTOR_INDEX_DTYPE):
+        """Write atomically to `directory` and return the mmapped index."""
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        matrix, scales = quantize(vectors, dtype)
+
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+        try:
+            np.save(os.path.join(tmp_dir, VECTORS_FILE), matrix)
+            if scales is not None:
+                np.save(os.path.join(tmp_dir, SCALES_FILE), scales)
+            with open(os.path.join(tmp_dir, CHUNKS_FILE), "w") as f:
+                json.dump([{"text": d.page_content, "metadata": d.metadata} for d in documents], f)
+            with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+                json.dump({
+                    "format": INDEX_FORMAT_VERSION,
+                    "dtype": dtype,
+                    "count": len(documents),
+                    "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+                }, f)
+            os.replace(tmp_dir, directory)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("format") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format in {directory}")
+
+        with open(os.path.join(directory, CHUNKS_FILE)) as f:
+            chunks = json.load(f)
+        documents = [Document(page_content=c["text"], metadata=c["metadata"]) for c in chunks]
+
+        # Empty arrays can't be memory-mapped
+        mmap_mode = "r" if meta["count"] else None
+        matrix = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode=mmap_mode)
+        scales = None
+        if meta["dtype"] == "int8":
+            scales = np.load(os.path.join(directory, SCALES_FILE))
+        return cls(documents, matrix, scales, directory=directory)
+
+    def vectors(self, positions) -> np.ndarray:
+        """Dequantized float32 rows (only these rows are read from the map)"""
+        rows = np.asarray(self.matrix[positions], dtype=np.float32)
+        if self.scales is not None:
+            rows *= self.scales[positions][:, None]
+        return rows
+
+    def scores(self, query_vector) -> np.ndarray:
+        """Inner product (cosine for normalized vectors) with every chunk"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        out = np.empty(len(self.documents), dtype=np.float32)
+        # Blocks bound the float32 temporaries for float16/int8 matrices
+        for start in range(0, len(out), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            out[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def search(self, query_vector, k: int):
+        """Return (positions, scores) of the k most similar chunks, best first."""
+        scores = self.scores(query_vector)
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
@@ -0,0 +1,39 @@
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """
+    Load the heavy ML dependencies and the embedding (and, if enabled,
+    re-ranker) model weights once.
+
+    Meant for the gunicorn master with preload_app (see gunicorn.conf.py):
+    workers forked afterwards share these pages copy-on-write instead of
+    each importing torch/unstructured and loading the model themselves.
+    Nothing is encoded here, so no torch/OpenMP thread pools exist before fork.
+    """
+    start = time.perf_counter()
+
+    from backend.partition import ensure_nltk_data
+    ensure_nltk_data()
+
+    # Imported only for the side effect of having them in memory before fork
+    for module in (
+        "langchain_openai",
+        "langchain_community.vectorstores.utils",
+        "unstructured.chunking.title",
+        "unstructured.partition.pdf",
+    ):
+        importlib.import_module(module)
+    logger.info(f"Warm-up: ML modules imported in {time.perf_counter() - start:.1f}s")
+
+    from backend.embeddings import get_embedding_service
+    get_embedding_service()
+
+    from backend.rerank import RERANK_CLASSES, get_reranker
+    if RERANK_CLASSES:
+        get_reranker()
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,81 @@
+"""
+Semantic answer-cache check: pairs of questions that differ only by a
+number or identifier must miss, paraphrases of the same question should hit.
+
+Each pair is stored and looked up on a fresh AnswerCache. --embeddings model
+uses the real embedding model (must already be in the local HF cache) and
+also prints each pair's cosine; --embeddings same gives both questions of a
+pair the same vector, the worst case for the identifier guard. Exits 1 if a
+must-miss pair hits.
+
+    python -m benchmarks.bench_answer_cache
+    python -m benchmarks.bench_answer_cache --embeddings model
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from backend import rag
+from backend.answer_cache import AnswerCache
+from backend.embeddings import EMBEDDING_DIM
+
+DOCUMENT_KEY = "bench"
+
+# (cached question, new question)
+MUST_MISS = [
+    ("What does clause 7 say?", "What does clause 8 say?"),
+    ("What is on page 12?", "What is on page 13?"),
+    ("What was the sum assured under policy PN-0037?", "What was the sum assured under policy PN-0038?"),
+    ("Why did the insurer repudiate claim CL-0012?", "Why did the insurer repudiate claim CL-0021?"),
+    ("What happened on 12 March 2019?", "What happened on 13 March 2019?"),
+    ("Summarize section 4.", "Summarize section 4.2."),
+    ("What does Annexure A say?", "What does Annexure B say?"),
+]
+SHOULD_HIT = [
+    ("What does clause 7 say?", "what does clause 7 state"),
+    ("What was the sum assured under policy PN-0037?", "What is the sum assured under policy PN-0037?"),
+    ("Summarize this document.", "Please summarize the document."),
+]
+
+
+def check(pairs, embed_pair):
+    results = []
+    for cached, asked in pairs:
+        cached_vector, asked_vector = embed_pair(cached, asked)
+        cache = AnswerCache()
+        cache.store(DOCUMENT_KEY, cached, cached_vector, {"answer": cached})
+        hit = cache.lookup(DOCUMENT_KEY, asked, lambda query: asked_vector) is not None
+        results.append((cached, asked, float(cached_vector @ asked_vector), hit))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--embeddings", choices=["model", "same"], default="same")
+    args = parser.parse_args()
+
+    if args.embeddings == "model":
+        embeddings = rag.get_embedding_service()
+
+        def embed_pair(a, b):
+            return embeddings.embed_query_vector(a), embeddings.embed_query_vector(b)
+    else:
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        vector[0] = 1.0
+
+        def embed_pair(a, b):
+            return vector, vector
+
+    failures = 0
+    for label, pairs, want_hit in (("must miss", MUST_MISS, False), ("should hit", SHOULD_HIT, True)):
+        print(f"== {label} ==")
+        for cached, asked, cosine, hit in check(pairs, embed_pair):
+            ok = hit == want_hit
+            failures += not ok and not want_hit
+            print(f"{'ok  ' if ok else 'FAIL'} cos={cosine:.3f} {'hit ' if hit else 'miss'} {cached!r} -> {asked!r}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Per-request auth cost: the old require_auth path (JWKS lookup + ES256
+verification on every call) vs. verify_token with the key and token caches.
+
+Uses a locally generated ES256 keypair served from a JWKS endpoint on
+127.0.0.1, so no Supabase project is involved.
+
+    python -m benchmarks.bench_auth --requests 2000 --tokens 50
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec
+from jwt import PyJWKClient
+from jwt.algorithms import ECAlgorithm
+
+from backend import auth
+
+KID = "bench-key"
+
+
+def serve_jwks(public_key):
+    jwk = ECAlgorithm.to_jwk(public_key, as_dict=True)
+    body = json.dumps({"keys": [dict(jwk, kid=KID, alg="ES256", use="sig")]}).encode()
+    fetches = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            fetches.append(time.time())
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/auth/v1/.well-known/jwks.json", fetches
+
+
+def make_token(private_key, user_number):
+    now = int(time.time())
+    return jwt.encode(
+        {
+            "sub": f"user-{user_number}",
+            "email": f"user{user_number}@example.com",
+            "aud": "authenticated",
+            "iss": auth.ISSUER,
+            "iat": now,
+            "exp": now + 3600,
+        },
+        private_key,
+        algorithm="ES256",
+        headers={"kid": KID},
+    )
+
+
+def timed(fn, tokens):
+    samples = []
+    for token in tokens:
+        start = time.perf_counter()
+        fn(token)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(0.95 * (len(samples) - 1))]
+    print(f"{name:<34} p50={statistics.median(samples):9.1f} us  p95={p95:9.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--tokens", type=int, default=50, help="distinct users/tokens in the request mix")
+    args = parser.parse_args()
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    url, fetches = serve_jwks(private_key.public_key())
+    tokens = [make_token(private_key, i) for i in range(args.tokens)]
+    requests = [tokens[i % len(tokens)] for i in range(args.requests)]
+
+    client = PyJWKClient(url)
+
+    def old_path(token):
+        signing_key = client.get_signing_key_from_jwt(token).key
+        return jwt.decode(token, signing_key, algorithms=["ES256"], audience="authenticated", issuer=auth.ISSUER)
+
+    old_path(tokens[0])  # warm the JWK set cache, like a long-running worker
+    report("per-request verify (old)", timed(old_path, requests))
+
+    auth.signing_keys = auth.SigningKeys(PyJWKClient(url))
+    auth.token_cache = auth.TokenCache()
+    fetches.clear()
+
+    report("verify_token, first sight", timed(auth.verify_token, tokens))
+    report("verify_token, repeat tokens", timed(auth.verify_token, requests))
+    print(f"JWKS fetches during verify_token runs: {len(fetches)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Keyword retrieval latency: BM25Retriever rebuilt per question (old ask() path)
+vs. querying the BM25Index built once at ingest.
+
+    python -m benchmarks.bench_bm25 --chunks 4000 --queries 50
+"""
+import argparse
+import random
+import statistics
+import time
+
+from langchain_core.documents import Document
+from langchain_community.retrievers import BM25Retriever
+
+from backend.bm25 import BM25Index
+
+
+def synthetic_chunks(n_chunks, vocab_size=20000, words_per_chunk=220, seed=0):
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(vocab_size)]
+    # Zipf-ish weights so some terms are common, like real legal text
+    weights = [1.0 / (i + 1) for i in range(vocab_size)]
+    return [
+        Document(page_content=" ".join(rng.choices(vocab, weights, k=words_per_chunk)))
+        for _ in range(n_chunks)
+    ], vocab
+
+
+def timed(fn, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(0.95 * (len(samples) - 1))]
+    print(f"{name:<28} p50={statistics.median(samples):9.2f} ms  p95={p95:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=4000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=14)
+    args = parser.parse_args()
+
+    chunks, vocab = synthetic_chunks(args.chunks)
+    rng = random.Random(1)
+    queries = [" ".join(rng.choices(vocab[:2000], k=6)) for _ in range(args.queries)]
+
+    def rebuild_per_query(query):
+        retriever = BM25Retriever.from_documents(chunks)
+        retriever.k = args.k
+        return retriever.invoke(query)
+
+    start = time.perf_counter()
+    index = BM25Index(chunks)
+    print(f"BM25Index build: {(time.perf_counter() - start) * 1000:.1f} ms for {len(chunks)} chunks")
+
+    report("BM25Retriever (per query)", timed(rebuild_per_query, queries))
+    report("BM25Index.search", timed(lambda q: index.search(q, args.k), queries))
+
+
+if __name__ == "__main__":
+    main()
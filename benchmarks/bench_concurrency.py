@@ -0,0 +1,182 @@
+"""
+Threaded load test for one shared ChatPDF: reader threads call ask() in a
+loop while a writer thread keeps adding and removing a second document.
+
+Reports throughput and latency per thread count, plus two correctness
+counters that must stay at 0: exceptions, and answers whose sources match
+neither the one-document nor the two-document state (what a reader mixing
+two index versions would produce). The model is a stub that sleeps for
+--llm-ms, standing in for the upstream call a real worker waits on.
+
+    python -m benchmarks.bench_concurrency --threads 1 2 4 8 --seconds 5
+    python -m benchmarks.bench_concurrency --pages 200 --llm-ms 0
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from backend import rag
+from backend.answer_cache import AnswerCache
+from backend.vector_index import VectorIndex
+from benchmarks.bench_e2e import HashEmbeddings, percentile
+from benchmarks.fixtures import page_lines
+
+CHUNK_CHARS = 1100
+BASE_FILE = "base"
+EXTRA_FILE = "extra"
+
+
+def build_index(directory, n_pages, seed, embeddings):
+    """Chunks straight from the fixture text (no PDF round trip), saved and mmapped"""
+    rng = random.Random(seed)
+    documents, questions = [], []
+    for page in range(1, n_pages + 1):
+        lines, facts = page_lines(page, rng)
+        text = " ".join(line for line in lines if line)
+        for start in range(0, len(text), CHUNK_CHARS):
+            documents.append(Document(
+                page_content=text[start:start + CHUNK_CHARS + 200],
+                metadata={"filename": os.path.basename(directory), "page_number": page},
+            ))
+        questions += [question for _, _, question, _ in facts]
+    vectors = embeddings.encode([doc.page_content for doc in documents])
+    return VectorIndex.save(directory, documents, vectors), questions
+
+
+def source_key(sources):
+    return tuple((ref["file_id"], ref["page_number"], ref["score"]) for ref in sources)
+
+
+def expected_sources(chatpdf, questions):
+    """question -> sources when asked with file_ids=[BASE_FILE], on the current snapshot"""
+    expected = {}
+    for question in questions:
+        sources = []
+        chatpdf.ask(question, sources=sources, file_ids=[BASE_FILE])
+        expected[question] = source_key(sources)
+    return expected
+
+
+def run(chatpdf, extra_index, questions, valid, n_threads, seconds):
+    stop = threading.Event()
+    latencies, errors, mismatches, swaps = [], [], [0], [0]
+    lock = threading.Lock()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        local = []
+        while not stop.is_set():
+            question = rng.choice(questions)
+            # Half the questions span both files, half pin the base file and are checked
+            pinned = rng.random() < 0.5
+            sources = []
+            start = time.perf_counter()
+            try:
+                chatpdf.ask(question, sources=sources, file_ids=[BASE_FILE] if pinned else None)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            local.append(time.perf_counter() - start)
+            bad = any(ref["file_id"] not in (BASE_FILE, EXTRA_FILE) for ref in sources)
+            if pinned and source_key(sources) not in valid[question]:
+                bad = True
+            if bad:
+                with lock:
+                    mismatches[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    def writer():
+        while not stop.is_set():
+            chatpdf.add_document(extra_index, "extra.pdf", file_id=EXTRA_FILE)
+            time.sleep(0.005)
+            chatpdf.remove_document(EXTRA_FILE)
+            swaps[0] += 2
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(n_threads)]
+    threads.append(threading.Thread(target=writer))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "threads": n_threads,
+        "questions": len(latencies),
+        "qps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else 0.0,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else 0.0,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "swaps": swaps[0],
+        "errors": errors,
+        "mismatches": mismatches[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--llm-ms", type=float, default=50.0, help="simulated model latency")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Per-question INFO logging would dominate (and serialize) the timings
+    logging.disable(logging.INFO)
+    workdir = tempfile.mkdtemp(prefix="bench-concurrency-")
+    rag.answer_cache = AnswerCache(max_entries=0)  # every ask() retrieves
+    embeddings = HashEmbeddings()
+
+    def fake_model(prompt):
+        time.sleep(args.llm_ms / 1000)
+        return "Missing from provided context."
+
+    try:
+        base_index, questions = build_index(os.path.join(workdir, "base"), args.pages, args.seed, embeddings)
+        extra_index, _ = build_index(os.path.join(workdir, "extra"), args.pages, args.seed + 1, embeddings)
+
+        chatpdf = rag.ChatPDF(model=RunnableLambda(fake_model))
+        chatpdf.embeddings = embeddings
+        chatpdf.load(base_index, "base.pdf", file_id=BASE_FILE)
+
+        # BM25 statistics are corpus-wide, so pinned answers legitimately
+        # differ between the two states; anything else is a torn read
+        sample = questions[:200]
+        alone = expected_sources(chatpdf, sample)
+        chatpdf.add_document(extra_index, "extra.pdf", file_id=EXTRA_FILE)
+        together = expected_sources(chatpdf, sample)
+        chatpdf.remove_document(EXTRA_FILE)
+        valid = {question: {alone[question], together[question]} for question in sample}
+
+        print(f"{len(base_index)} + {len(extra_index)} chunks, model latency {args.llm_ms:.0f} ms")
+        for n_threads in args.threads:
+            result = run(chatpdf, extra_index, sample, valid, n_threads, args.seconds)
+            print(
+                f"threads={result['threads']:<3} {result['qps']:8.1f} q/s  p50={result['p50_ms']:7.1f} ms  "
+                f"p95={result['p95_ms']:7.1f} ms  swaps={result['swaps']:<6} "
+                f"errors={len(result['errors'])}  mismatches={result['mismatches']}"
+            )
+            for error in result["errors"][:3]:
+                print(f"    {error}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Offline end-to-end benchmark: ingest synthetic legal PDFs of several sizes,
+then ask a labelled question set through ChatPDF with a fake chat model.
+
+Per document size it reports ingest time per stage, index size and memory,
+ask() latency p50/p95/p99 per classify_query class, and retrieval recall
+(share of questions whose answer chunk ask() retrieved, after any re-rank /
+put into the packed context), and how often the query router picked the
+question's labelled class. No network is needed with --embeddings hash; the default
+uses the real embedding model, which must already be in the local HF cache.
+
+    python -m benchmarks.bench_e2e --pages 10 100 1000 --questions 40
+    python -m benchmarks.bench_e2e --pages 10 --embeddings hash --json out.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from langchain_core.language_models import FakeListChatModel
+
+from backend import rag
+from backend.answer_cache import AnswerCache
+from backend.context import context_packer
+from backend.embeddings import EMBEDDING_DIM, normalize_query
+from backend.ingest_cache import IngestCache
+from benchmarks.fixtures import synthetic_document
+
+FAKE_ANSWER = "Missing from provided context."
+
+
+class HashEmbeddings:
+    """
+    Deterministic hashed bag-of-words vectors with the EmbeddingService
+    interface. Not semantic: use it for timing runs without the model, not
+    for judging dense retrieval quality.
+    """
+
+    cache_tag = f"hash-{EMBEDDING_DIM}"
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                vectors[row, zlib.crc32(token.encode()) % EMBEDDING_DIM] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query_vector(self, text):
+        return self.encode([normalize_query(text)])[0]
+
+    def embed_query(self, text):
+        return self.embed_query_vector(text).tolist()
+
+
+class AskTrace:
+    """
+    What ChatPDF.ask() itself used for its last question: the query class,
+    the chunks it handed to the context packer (after any re-rank) and the
+    packed context. Wraps the instance's classify_query and rag's packer.
+    """
+
+    def __init__(self, chatpdf):
+        self.classification = self.retrieved = self.packed = None
+        self._classify_query = chatpdf.classify_query
+        chatpdf.classify_query = self.classify_query
+        rag.context_packer = self
+
+    def classify_query(self, *args, **kwargs):
+        self.classification = self._classify_query(*args, **kwargs)
+        return self.classification
+
+    def pack(self, documents, scores):
+        self.retrieved = documents
+        self.packed = context_packer.pack(documents, scores)
+        return self.packed
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def contains(documents, needle):
+    return any(needle in " ".join(doc.page_content.split()) for doc in documents)
+
+
+def ingest(pdf_path, embeddings):
+    """Stage timings from prepare_document's progress callback, plus load()"""
+    marks = []
+
+    def progress(stage, percent):
+        if not marks or marks[-1][0] != stage:
+            marks.append((stage, time.perf_counter()))
+
+    start = time.perf_counter()
+    vector_index = rag.prepare_document(pdf_path, progress=progress, embeddings=embeddings)
+    marks.append(("load", time.perf_counter()))
+
+    chatpdf = rag.ChatPDF(model=FakeListChatModel(responses=[FAKE_ANSWER]))
+    chatpdf.embeddings = embeddings
+    chatpdf.load(vector_index)
+    end = time.perf_counter()
+
+    timings = {"hashing": marks[0][1] - start}
+    for (stage, at), (_, next_at) in zip(marks, marks[1:] + [(None, end)]):
+        timings[stage] = timings.get(stage, 0.0) + next_at - at
+    timings["total"] = end - start
+    return chatpdf, vector_index, timings
+
+
+def run(n_pages, args, embeddings, workdir):
+    pdf_path = os.path.join(workdir, f"synthetic-{n_pages}.pdf")
+    questions = synthetic_document(pdf_path, n_pages, seed=args.seed)
+    rng = random.Random(args.seed)
+    by_class = defaultdict(list)
+    for question in questions:
+        by_class[question["class"]].append(question)
+    sample = [q for items in by_class.values() for q in rng.sample(items, min(args.questions, len(items)))]
+
+    chatpdf, vector_index, ingest_timings = ingest(pdf_path, embeddings)
+
+    trace = AskTrace(chatpdf)
+    latencies = defaultdict(list)
+    hits = defaultdict(lambda: {"retrieved": 0, "context": 0, "routed": 0, "total": 0})
+    for question in sample:
+        trace.classification = trace.retrieved = trace.packed = None
+        start = time.perf_counter()
+        chatpdf.ask(question["question"])
+        elapsed = time.perf_counter() - start
+        if trace.classification is None:
+            continue  # the document produced no chunks; ask() had nothing to retrieve from
+        latencies[trace.classification["type"]].append(elapsed)
+
+        # Recall, from the retrieval + packing ask() just did
+        counts = hits[question["class"]]
+        counts["total"] += 1
+        counts["retrieved"] += contains(trace.retrieved, question["needle"])
+        counts["context"] += contains(trace.packed["documents"], question["needle"])
+        counts["routed"] += trace.classification["type"] == question["class"]
+
+    return {
+        "pages": n_pages,
+        "chunks": len(vector_index),
+        "ingest_seconds": ingest_timings,
+        "index_disk_bytes": directory_bytes(vector_index.directory) if vector_index.directory else 0,
+        "index_memory_bytes": chatpdf.memory_bytes(),
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "ask_ms": {
+            cls: {
+                "n": len(samples),
+                "p50": percentile(samples, 50) * 1000,
+                "p95": percentile(samples, 95) * 1000,
+                "p99": percentile(samples, 99) * 1000,
+            }
+            for cls, samples in sorted(latencies.items())
+        },
+        "recall": {
+            cls: {
+                "retrieved": counts["retrieved"] / counts["total"],
+                "context": counts["context"] / counts["total"],
+                "routed": counts["routed"] / counts["total"],
+            }
+            for cls, counts in sorted(hits.items())
+        },
+    }
+
+
+def report(result):
+    print(f"\n== {result['pages']} pages, {result['chunks']} chunks ==")
+    print("ingest: " + ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in result["ingest_seconds"].items()))
+    print(
+        f"index: {result['index_disk_bytes'] / 1e6:.1f} MB on disk, "
+        f"{result['index_memory_bytes'] / 1e6:.1f} MB resident, max RSS {result['max_rss_bytes'] / 1e6:.0f} MB"
+    )
+    for cls, stats in result["ask_ms"].items():
+        print(f"ask {cls:<9} n={stats['n']:<4} p50={stats['p50']:8.1f} ms  p95={stats['p95']:8.1f} ms  "
+              f"p99={stats['p99']:8.1f} ms")
+    for cls, recall in result["recall"].items():
+        print(f"recall {cls:<9} retrieved={recall['retrieved']:.2f}  in context={recall['context']:.2f}  "
+              f"routed={recall['routed']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--questions", type=int, default=40, help="questions per class")
+    parser.add_argument("--embeddings", choices=["model", "hash"], default="model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-e2e-")
+    # Cold ingests every time, and no answer-cache hits between repeated runs
+    rag.ingest_cache = IngestCache(os.path.join(workdir, "ingest-cache"))
+    rag.answer_cache = AnswerCache(max_entries=0)
+    if args.embeddings == "hash":
+        embeddings = HashEmbeddings()
+    else:
+        embeddings = rag.get_embedding_service()
+
+    try:
+        results = []
+        for n_pages in args.pages:
+            results.append(run(n_pages, args, embeddings, workdir))
+            report(results[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Wall-clock partition time vs. worker count for one PDF.
+
+    python -m benchmarks.bench_partition path/to/filing.pdf --workers 1 2 4 8 16
+
+The first run per worker count includes spawning the pool and loading the
+layout model in each process, so it is reported separately from the warm run.
+
+This measures one ingest on its own. In the app each of the INGEST_WORKERS
+ingest processes has its own partition pool, so concurrent uploads use up to
+INGEST_WORKERS x PARTITION_WORKERS processes; the PARTITION_WORKERS default
+is cpu_count // INGEST_WORKERS to keep that at about one process per core.
+Pick the value from this benchmark with that product in mind.
+"""
+import argparse
+import time
+
+from pypdf import PdfReader
+
+from backend import partition
+from backend.rag import PARTITION_PARAMS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    n_pages = len(PdfReader(args.pdf).pages)
+    print(f"{args.pdf}: {n_pages} pages, params={PARTITION_PARAMS}")
+
+    print(f"adaptive={partition.adaptive_params()} (set PARTITION_ADAPTIVE=0 for all-hi_res timings)")
+
+    baseline = None
+    for workers in args.workers:
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            elements, page_strategies = partition.partition_pdf_parallel(args.pdf, PARTITION_PARAMS, workers=workers)
+            timings.append(time.perf_counter() - start)
+        cold, warm = timings
+        baseline = baseline or warm
+        print(
+            f"workers={workers:<3} cold={cold:8.1f}s warm={warm:8.1f}s "
+            f"speedup={baseline / warm:5.2f}x pages/s={n_pages / warm:6.2f} elements={len(elements)} "
+            f"hi_res_pages={sum(1 for s in page_strategies.values() if s != 'fast')}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Cold-start cost: wall time to import app.py (what every gunicorn worker pays
+on boot) and backend.rag in fresh interpreters, plus the one-off warm-up.
+
+    SUPABASE_FAKE=1 python -m benchmarks.bench_startup --runs 5
+
+--importtime lists the slowest modules behind `import app` (python -X importtime).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+TARGETS = {
+    "import app": "import app",
+    "import backend.rag": "import backend.rag",
+    "warm_up()": "from backend.warmup import warm_up; warm_up()",
+}
+
+
+def run_timed(code):
+    script = f"import time; _t = time.perf_counter(); {code}; print(time.perf_counter() - _t)"
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, SUPABASE_FAKE=os.getenv("SUPABASE_FAKE", "1")),
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, SUPABASE_FAKE=os.getenv("SUPABASE_FAKE", "1")),
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:10.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="show the N slowest imports")
+    args = parser.parse_args()
+
+    for name, code in TARGETS.items():
+        runs = args.runs if name != "warm_up()" else 1
+        try:
+            samples = [run_timed(code) for _ in range(runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"{name:<20} failed: {(e.stderr or '').strip().splitlines()[-1:]}")
+            continue
+        print(f"{name:<20} median={statistics.median(samples) * 1000:9.1f} ms  "
+              f"max={max(samples) * 1000:9.1f} ms  ({runs} runs)")
+
+    if args.importtime:
+        slowest_imports(args.importtime)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Synthetic legal PDFs with a labelled question set, for the offline benchmarks.
+
+Every page is one numbered section of an insurance dispute: filler legal
+prose around a few planted facts (policy details, claim rejections, revival
+conditions, ombudsman complaints). Each fact has a question phrased to land
+in one classify_query class and a `needle` string that only the chunk(s)
+holding that fact contain, which is what retrieval recall is scored on.
+
+The PDF is written by hand (Helvetica text, one content stream per page), so
+every page has a text layer and no PDF library beyond pypdf is needed.
+"""
+import random
+
+CITIES = ["Mumbai", "Delhi", "Pune", "Chennai", "Kolkata", "Jaipur", "Lucknow", "Bhopal", "Kochi", "Patna"]
+REASONS = [
+    "non-disclosure of a pre-existing condition",
+    "late intimation of the claim",
+    "lapse of the policy for non-payment of premium",
+    "misstatement of age in the proposal form",
+    "exclusion of self-inflicted injury",
+    "failure to submit the discharge summary",
+    "absence of an insurable interest",
+    "breach of the warranty on occupation",
+]
+PROCEDURES = [
+    "paying all arrears with interest within two years",
+    "submitting a fresh declaration of good health",
+    "undergoing a medical examination at the insurer's cost",
+    "filing a written request with the branch office",
+    "paying a revival fee and the late charges",
+]
+TOPICS = [
+    "Background of the Dispute", "Issuance of the Policy", "Premium Payment History", "Lapse and Revival",
+    "Intimation of Claim", "Repudiation by the Insurer", "Proceedings before the Ombudsman",
+    "Submissions of the Complainant", "Submissions of the Respondent", "Findings",
+]
+FILLER = (
+    "the complainant submitted that the respondent insurer acted contrary to the terms of the policy "
+    "and the regulations framed under the insurance act while the respondent contended that the "
+    "documents on record establish compliance with every condition precedent to liability and that "
+    "the forum must confine itself to the contract between the parties as pleaded in the complaint"
+).split()
+
+LINES_PER_PAGE = 56
+CHARS_PER_LINE = 95
+
+
+def _sentence(rng, words=18):
+    text = " ".join(rng.choice(FILLER) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def page_facts(page, rng):
+    """The planted facts on `page`: [(class, text, question, needle)]"""
+    policy = f"PN-{page:04d}"
+    amount = f"Rs. {rng.randint(1, 99) * 25000:,}"
+    claim = f"CL-{page:04d}"
+    reason = rng.choice(REASONS)
+    procedure = rng.choice(PROCEDURES)
+    complaint = f"CMP-{page:04d}"
+    city = rng.choice(CITIES)
+    return [
+        ("factual",
+         f"Policy {policy} was issued on {rng.randint(1, 28)} March {rng.randint(2005, 2020)} "
+         f"for a sum assured of {amount}.",
+         f"What was the sum assured under policy {policy}?",
+         policy),
+        ("analysis",
+         f"The insurer repudiated claim {claim} on the ground of {reason}.",
+         f"Why did the insurer repudiate claim {claim}?",
+         claim),
+        ("process",
+         f"Under clause {page}.4 a lapsed policy may be revived by {procedure}.",
+         f"Under what conditions can a lapsed policy be revived under clause {page}.4?",
+         f"clause {page}.4"),
+        ("general",
+         f"Complaint {complaint} was heard by the Insurance Ombudsman at {city}.",
+         f"Which ombudsman office heard complaint {complaint}?",
+         complaint),
+    ]
+
+
+def page_lines(page, rng):
+    """(lines of text for the page, facts planted on it)"""
+    facts = page_facts(page, rng)
+    paragraphs = [f"SECTION {page}. {TOPICS[page % len(TOPICS)].upper()}"]
+    for _, text, _, _ in facts:
+        paragraphs.append(" ".join(_sentence(rng) for _ in range(3)) + " " + text)
+    paragraphs.append(" ".join(_sentence(rng) for _ in range(4)))
+
+    lines = []
+    for paragraph in paragraphs:
+        line = ""
+        for word in paragraph.split():
+            if len(line) + len(word) + 1 > CHARS_PER_LINE:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    return lines[:LINES_PER_PAGE], facts
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Minimal PDF 1.4 writer: `pages` is a list of line lists."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for lines in pages:
+        stream = ["BT", "/F1 10 Tf", "12 TL", "50 770 Td"]
+        stream += [f"({_escape(line)}) Tj T*" for line in lines]
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{kid} 0 R" for kid in kids).encode(), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def synthetic_document(path, n_pages, seed=0):
+    """
+    Write an `n_pages` PDF to `path` and return its labelled questions:
+    [{"class", "question", "needle", "page"}].
+    """
+    rng = random.Random(seed)
+    pages, questions = [], []
+    for page in range(1, n_pages + 1):
+        lines, facts = page_lines(page, rng)
+        pages.append(lines)
+        questions += [
+            {"class": cls, "question": question, "needle": needle, "page": page}
+            for cls, _, question, needle in facts
+        ]
+    write_pdf(path, pages)
+    return questions
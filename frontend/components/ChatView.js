@@ -23,7 +23,7 @@ export default {
           </p>
           <p class="doc-meta">
             Status:
-            <span v-if="docStatus === 'processing'">Processing…</span>
+            <span v-if="docStatus === 'processing'">Processing… {{ uploadPercent }}%</span>
             <span v-else-if="docStatus === 'indexed'">Indexed</span>
             <span v-else>—</span>
           </p>
@@ -50,7 +50,7 @@ export default {
           </div>
 
           <!-- Loading indicator for assistant -->
-          <div v-if="isAsking" class="message assistant">
+          <div v-if="isAsking && !isStreaming" class="message assistant">
             <div class="message-content">
               <p>Thinking…</p>
             </div>
@@ -127,6 +127,8 @@ export default {
 
       // document state
       docName: null,
+      documentId: null,
+      uploadPercent: 0,
       docStatus: "idle", // idle | processing | indexed
       questionCount: 0,
       maxQuestions: 50,
@@ -134,6 +136,7 @@ export default {
       // async flags
       isUploading: false,
       isAsking: false,
+      isStreaming: false,
 
       // chat
       messages: []
@@ -170,17 +173,43 @@ export default {
           throw new Error("Upload failed");
         }
 
+        const { job_id } = await res.json();
+        this.documentId = await this.waitForIngest(job_id);
         this.docStatus = "indexed";
       } catch (err) {
         console.error(err);
         alert("Failed to process document.");
         this.docStatus = "idle";
         this.docName = null;
+        this.documentId = null;
         }finally {    
             this.isUploading = false;
             e.target.value = ""; // reset file input
         }
     },
+    async waitForIngest(jobId) {
+      // Upload returns immediately; poll the ingest job until it finishes
+      this.uploadPercent = 0;
+      while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1500));
+
+        const res = await fetch(`/api/upload/${jobId}`, {
+          headers: {
+            Authorization: "Bearer " + localStorage.getItem("token")
+          }
+        });
+        if (!res.ok) {
+          throw new Error("Upload status failed");
+        }
+
+        const job = await res.json();
+        this.uploadPercent = job.percent;
+        if (job.state === "done") return job.document_id;
+        if (job.state === "failed" || job.state === "cancelled") {
+          throw new Error(job.error || "Ingest " + job.state);
+        }
+      }
+    },
     async logout() {
         await supabaseClient.auth.signOut();
 
@@ -219,13 +248,13 @@ export default {
       this.questionCount++;
 
       try {
-        const res = await fetch("/api/ask", {
+        const res = await fetch("/api/ask/stream", {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
             Authorization: "Bearer " + localStorage.getItem("token")
           },
-          body: JSON.stringify({ question })
+          body: JSON.stringify({ question, document_id: this.documentId })
         });
 
         if (res.status === 429) {
@@ -241,12 +270,7 @@ export default {
           throw new Error("Ask failed");
         }
 
-        const data = await res.json();
-
-        this.messages.push({
-          role: "assistant",
-          content: data.answer
-        });
+        await this.readAnswerStream(res);
       } catch (err) {
         this.messages.push({
           role: "assistant",
@@ -254,6 +278,42 @@ export default {
         });
       } finally {
         this.isAsking = false;
+        this.isStreaming = false;
+      }
+    },
+    async readAnswerStream(res) {
+      // Server-Sent Events over fetch (EventSource can't send the auth header)
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let answer = null;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+          const frame = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+
+          const event = (frame.match(/^event: (.*)$/m) || [])[1];
+          const data = JSON.parse((frame.match(/^data: (.*)$/m) || [])[1] || "{}");
+
+          if (event === "token") {
+            if (!answer) {
+              // First token: replace the "Thinking…" indicator with the answer
+              this.isStreaming = true;
+              answer = { role: "assistant", content: "" };
+              this.messages.push(answer);
+              answer = this.messages[this.messages.length - 1];
+            }
+            answer.content += data.text;
+          } else if (event === "error") {
+            throw new Error(data.error);
+          }
+        }
       }
     },
     async fetchLimits() {
@@ -0,0 +1,18 @@
+import os
+
+# GUNICORN_PRELOAD=1: import the app and run the warm-up once in the master,
+# then fork workers that share the loaded modules and model weights.
+# Off by default, so each worker imports only what its requests need.
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+
+def when_ready(server):
+    # Master process, after the app is loaded and before workers are forked
+    if preload_app:
+        from backend.warmup import warm_up
+        warm_up()
+
+# GUNICORN_THREADS>1 switches to gthread workers: several requests share one
+# process (and one copy of the model). ChatPDF readers work on immutable
+# index snapshots, so concurrent questions and uploads are safe.
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
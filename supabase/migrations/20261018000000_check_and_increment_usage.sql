@@ -0,0 +1,59 @@
+-- Atomic daily usage check for backend/limits.py.
+-- One round trip replaces ensure_user_row + select + reset + increment, and the
+-- row lock makes concurrent requests for the same user serialize correctly.
+--
+-- p_action: 'ask' | 'upload' increment when under the limit; anything else
+-- ('peek') only applies the daily reset and returns the counters.
+
+create or replace function public.check_and_increment_usage(
+    p_user_id uuid,
+    p_action text,
+    p_max_questions int,
+    p_max_uploads int
+)
+returns table (allowed boolean, questions_used int, uploads_used int, last_reset date)
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    usage usage_limits%rowtype;
+    today date := current_date;
+    is_allowed boolean := true;
+begin
+    insert into usage_limits (user_id, questions_used, uploads_used, last_reset)
+    values (p_user_id, 0, 0, today)
+    on conflict (user_id) do nothing;
+
+    select * into usage from usage_limits u where u.user_id = p_user_id for update;
+
+    if usage.last_reset is distinct from today then
+        usage.questions_used := 0;
+        usage.uploads_used := 0;
+        usage.last_reset := today;
+    end if;
+
+    if p_action = 'ask' then
+        is_allowed := usage.questions_used < p_max_questions;
+        if is_allowed then
+            usage.questions_used := usage.questions_used + 1;
+        end if;
+    elsif p_action = 'upload' then
+        is_allowed := usage.uploads_used < p_max_uploads;
+        if is_allowed then
+            usage.uploads_used := usage.uploads_used + 1;
+        end if;
+    end if;
+
+    update usage_limits u
+    set questions_used = usage.questions_used,
+        uploads_used = usage.uploads_used,
+        last_reset = usage.last_reset
+    where u.user_id = p_user_id;
+
+    return query select is_allowed, usage.questions_used, usage.uploads_used, usage.last_reset;
+end;
+$$;
+
+revoke all on function public.check_and_increment_usage(uuid, text, int, int) from public, anon, authenticated;
+grant execute on function public.check_and_increment_usage(uuid, text, int, int) to service_role;